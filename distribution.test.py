@@ -0,0 +1,83 @@
+import hashlib
+import random
+import time
+from distribution import MerkleTree, leaf_hash, pack_claim, verify_proof
+from distribution.michelson import (
+    ADDRESS_PREFIXES,
+    BASE58_ALPHABET,
+    encode_address,
+    encode_nat,
+)
+
+# Merkle tree builder test on a generated drop of 100k stakers.
+#
+# Every sampled proof must lead to the root, and fail for another amount or
+# another staker. Duplicate addresses are rejected. The Michelson encoding is
+# checked on known values.
+
+
+def base58check_encode(payload):
+    data = payload + hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+    number = int.from_bytes(data, "big")
+    chars = ""
+    while number:
+        number, digit = divmod(number, 58)
+        chars = BASE58_ALPHABET[digit] + chars
+    return "1" * (len(data) - len(data.lstrip(b"\x00"))) + chars
+
+
+def generate_entries(rng, count):
+    for _ in range(count):
+        kind = rng.choice(["tz1", "tz2", "tz3", "KT1"])
+        address = base58check_encode(ADDRESS_PREFIXES[kind][0] + rng.randbytes(20))
+        yield address, rng.randint(1, 10**9)
+
+
+if __name__ == "__main__":
+    # Known encodings
+    assert encode_nat(0) == b"\x00"
+    assert encode_nat(1) == b"\x01"
+    assert encode_nat(64) == b"\x80\x01"
+    assert encode_nat(1_000_000) == b"\x80\x89\x7a"
+    bootstrap1 = "tz1KqTpEZ7Yob7QbPE4Hy4Wo8fHG8LhKxZSx"
+    assert encode_address(bootstrap1)[:2] == b"\x00\x00"
+    assert len(encode_address(bootstrap1)) == 22
+    assert (
+        base58check_encode(bytes([6, 161, 159]) + encode_address(bootstrap1)[2:])
+        == bootstrap1
+    )
+    assert pack_claim(bootstrap1, 1).startswith(b"\x05\x07\x07\x0a\x00\x00\x00\x16")
+    assert pack_claim(bootstrap1, 1).endswith(b"\x00\x01")
+
+    # A single leaf is its own root
+    tree = MerkleTree([(bootstrap1, 5)])
+    assert tree.root == leaf_hash(bootstrap1, 5)
+    assert tree.proof(0) == []
+
+    # An address can only be claimed once, so it can only appear once
+    try:
+        MerkleTree([(bootstrap1, 5), (bootstrap1, 1)])
+    except ValueError as error:
+        assert bootstrap1 in str(error)
+    else:
+        raise AssertionError("Duplicate address accepted")
+
+    count = 100_003
+    started = time.perf_counter()
+    tree = MerkleTree(generate_entries(random.Random(0), count))
+    print("Built %d leaves in %.2fs" % (count, time.perf_counter() - started))
+    assert tree.count == count
+    assert len(tree.root) == 32
+
+    rng = random.Random(1)
+    samples = set(rng.sample(range(count), 200)) | {0, count - 1}
+    for index, (address, amount) in enumerate(
+        generate_entries(random.Random(0), count)
+    ):
+        if index in samples:
+            proof = tree.proof(index)
+            assert len(proof) <= 17
+            assert verify_proof(tree.root, leaf_hash(address, amount), proof)
+            assert not verify_proof(tree.root, leaf_hash(address, amount + 1), proof)
+            assert not verify_proof(tree.root, leaf_hash(bootstrap1, amount), proof)
+    print("Distribution OK")
@@ -0,0 +1,4 @@
+from distribution.michelson import leaf_hash, pack_claim
+from distribution.tree import MerkleTree, verify_proof
+
+__all__ = ["MerkleTree", "leaf_hash", "pack_claim", "verify_proof"]
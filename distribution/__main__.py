@@ -0,0 +1,31 @@
+import argparse
+import csv
+import json
+from distribution import MerkleTree
+
+# Usage:
+#   python -m distribution claims.csv --proofs proofs.jsonl
+#
+# `claims.csv` has one `address,amount` row per staker. The root and total are
+# the `publishDistribution` parameters, next to the chosen expiry. Each line of
+# the proofs file holds the `claimDistribution` parameters of one staker.
+
+
+def read_entries(path):
+    with open(path, newline="") as f:
+        for address, amount in csv.reader(f):
+            yield address.strip(), int(amount)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reward drop merkle tree builder")
+    parser.add_argument("claims", help="CSV file of address,amount rows")
+    parser.add_argument("--proofs", default="proofs.jsonl", help="Proofs output")
+    args = parser.parse_args()
+    tree = MerkleTree(read_entries(args.claims))
+    with open(args.proofs, "w") as f:
+        for claim in tree.proofs(read_entries(args.claims)):
+            f.write(json.dumps(claim) + "\n")
+    print("merkle_root: 0x%s" % tree.root.hex())
+    print("total: %d" % tree.total)
+    print("claims: %d" % tree.count)
@@ -0,0 +1,77 @@
+import hashlib
+
+# Michelson encoding of the distribution leaves.
+#
+# A leaf is the blake2b hash of `PACK (Pair user amount)`, as computed by
+# `claimDistribution`. Addresses are packed in their 22 bytes binary form
+# and amounts as Zarith integers.
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+# Base58 prefix and binary tag of each address kind
+ADDRESS_PREFIXES = {
+    "tz1": (bytes([6, 161, 159]), b"\x00\x00"),
+    "tz2": (bytes([6, 161, 161]), b"\x00\x01"),
+    "tz3": (bytes([6, 161, 164]), b"\x00\x02"),
+    "tz4": (bytes([6, 161, 166]), b"\x00\x03"),
+    "KT1": (bytes([2, 90, 121]), b"\x01"),
+}
+
+
+def blake2b(data):
+    return hashlib.blake2b(data, digest_size=32).digest()
+
+
+def base58check_decode(value):
+    number = 0
+    for char in value:
+        number = number * 58 + BASE58_ALPHABET.index(char)
+    data = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    data = b"\x00" * (len(value) - len(value.lstrip("1"))) + data
+    payload, checksum = data[:-4], data[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        raise ValueError("Invalid checksum: %s" % value)
+    return payload
+
+
+def encode_address(address):
+    """Return the 22 bytes binary form of a tz or KT1 address."""
+    if address[:3] not in ADDRESS_PREFIXES:
+        raise ValueError("Unknown address kind: %s" % address)
+    prefix, tag = ADDRESS_PREFIXES[address[:3]]
+    payload = base58check_decode(address)
+    if not payload.startswith(prefix) or len(payload) != len(prefix) + 20:
+        raise ValueError("Invalid address: %s" % address)
+    address_hash = payload[len(prefix) :]
+    if address.startswith("KT1"):
+        return tag + address_hash + b"\x00"
+    return tag + address_hash
+
+
+def encode_nat(value):
+    """Return the Zarith encoding of a natural number."""
+    if value < 0:
+        raise ValueError("Negative amount: %d" % value)
+    data = bytearray([value & 0x3F])
+    value >>= 6
+    while value:
+        data[-1] |= 0x80
+        data.append(value & 0x7F)
+        value >>= 7
+    return bytes(data)
+
+
+def pack_claim(address, amount):
+    """Return `PACK (Pair address amount)`."""
+    address_bytes = encode_address(address)
+    return (
+        b"\x05\x07\x07\x0a"
+        + len(address_bytes).to_bytes(4, "big")
+        + address_bytes
+        + b"\x00"
+        + encode_nat(amount)
+    )
+
+
+def leaf_hash(address, amount):
+    return blake2b(pack_claim(address, amount))
@@ -0,0 +1,91 @@
+from distribution.michelson import blake2b, leaf_hash
+
+# Merkle tree of a reward drop.
+#
+# Nodes are the blake2b hash of their two children in increasing order, like
+# `claimDistribution`. A node without sibling moves up unchanged. Each level
+# is kept as one bytearray of 32 bytes hashes, so a tree of n leaves takes
+# about 64 * n bytes whatever the size of the entries, next to the set of the
+# addresses seen.
+#
+# `claimDistribution` allows one claim per address, so an address can only
+# appear once: the leaf of a second entry could never be claimed but would
+# still count in the total.
+
+HASH_SIZE = 32
+
+
+def hash_pair(left, right):
+    if left < right:
+        return blake2b(left + right)
+    return blake2b(right + left)
+
+
+def verify_proof(root, leaf, proof):
+    node = leaf
+    for sibling in proof:
+        node = hash_pair(node, sibling)
+    return node == root
+
+
+class MerkleTree:
+    """Merkle tree built from a stream of `(address, amount)` entries."""
+
+    def __init__(self, entries):
+        leaves = bytearray()
+        addresses = set()
+        self.count = 0
+        self.total = 0
+        for address, amount in entries:
+            if address in addresses:
+                raise ValueError("Duplicate address %s" % address)
+            addresses.add(address)
+            leaves += leaf_hash(address, amount)
+            self.count += 1
+            self.total += amount
+        if self.count == 0:
+            raise ValueError("Empty distribution")
+        self.levels = [leaves]
+        while len(self.levels[-1]) > HASH_SIZE:
+            level = self.levels[-1]
+            parents = bytearray()
+            for start in range(0, len(level), 2 * HASH_SIZE):
+                pair = level[start : start + 2 * HASH_SIZE]
+                if len(pair) == HASH_SIZE:
+                    parents += pair
+                else:
+                    parents += hash_pair(
+                        bytes(pair[:HASH_SIZE]), bytes(pair[HASH_SIZE:])
+                    )
+            self.levels.append(parents)
+
+    @property
+    def root(self):
+        return bytes(self.levels[-1])
+
+    def node(self, depth, index):
+        return bytes(self.levels[depth][index * HASH_SIZE : (index + 1) * HASH_SIZE])
+
+    def leaf(self, index):
+        return self.node(0, index)
+
+    def proof(self, index):
+        """Return the sibling hashes from the leaf at `index` to the root."""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        proof = []
+        for depth in range(len(self.levels) - 1):
+            sibling = index ^ 1
+            if sibling * HASH_SIZE < len(self.levels[depth]):
+                proof.append(self.node(depth, sibling))
+            index //= 2
+        return proof
+
+    def proofs(self, entries):
+        """Yield the claim of each entry, `entries` in the order of the tree."""
+        for index, (address, amount) in enumerate(entries):
+            yield dict(
+                address=address,
+                amount=amount,
+                proof=["0x" + node.hex() for node in self.proof(index)],
+            )
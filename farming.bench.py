@@ -0,0 +1,340 @@
+import argparse
+import csv
+import json
+import smartpy as sp  # type: ignore
+from farming import farming_contract_module
+from farming_contract_types import farming_types
+from utilities.fa2_fungible_minimal import fa2_fungible
+from utilities.fa2_fungible_counting import fa2_counting
+
+# Cost benchmark of the farming contract entrypoints.
+#
+# The scenario creates `--farms` farms and lets `--users` users deposit,
+# harvest and withdraw `--elapsed` seconds apart. For each entrypoint call it
+# records the number of emitted operations, counted by the token contracts,
+# the storage diff (packed bytes of the touched farm and ledger entries) and
+# the packed size of the farm reward accumulator. The values are read with
+# `sc.compute`. The SmartPy interpreter does not meter gas, so budgets are
+# expressed on these metrics.
+#
+# With `--years`, a last farm runs for that many years with a single small
+# deposit harvested every 30 days, to check that the accumulator and the cost
+# of a harvest stay flat over the farm lifetime for the given `--precision`.
+# The precision only scales the accumulator by a constant factor, so it is
+# bounded per farm, by `reward_supply * precision / pool_balance`. The first
+# harvest of the deposit turns its zero reward debt into a full size one and
+# is checked against the `harvest_first` budget.
+#
+# Usage:
+#   python farming.bench.py --users 20 --farms 3 --elapsed 86400 \
+#       --report bench_report.json --budgets budgets.json
+#   python farming.bench.py --users 1 --farms 1 --years 4 --precision 1000000
+
+SCENARIO_NAME = "FarmingContractBench"
+
+# Default per-entrypoint budgets, overridden by `--budgets`
+BUDGETS = {
+    "createFarm": {"operations": 1, "storage_diff": 300},
+    "deposit": {"operations": 2, "storage_diff": 120},
+    "harvest": {"operations": 1, "storage_diff": 20, "acc_size": 16},
+    # A first harvest grows the accumulator and the reward debt from zero
+    "harvest_first": {"operations": 1, "storage_diff": 40, "acc_size": 16},
+    "withdraw": {"operations": 2, "storage_diff": 20},
+    "endFarm": {"operations": 1, "storage_diff": 0},
+}
+
+METRICS = ["operations", "storage_diff", "acc_size"]
+
+MONTH = 30 * 86_400
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Farming contract cost benchmark")
+    parser.add_argument("--users", type=int, default=5, help="Number of stakers")
+    parser.add_argument("--farms", type=int, default=2, help="Number of farms")
+    parser.add_argument(
+        "--elapsed", type=int, default=3_600, help="Seconds between two actions"
+    )
+    parser.add_argument(
+        "--report", default="bench_report.json", help="Report path (.json or .csv)"
+    )
+    parser.add_argument("--budgets", help="JSON file with per-entrypoint budgets")
+    parser.add_argument(
+        "--years", type=int, default=0, help="Lifetime of the long running farm"
+    )
+    parser.add_argument(
+        "--precision", type=int, help="Precision of the long running farm"
+    )
+    return parser.parse_args()
+
+
+class Bench:
+    """Run entrypoint calls and record their cost."""
+
+    def __init__(self, sc, farming_contract, tokens):
+        self.sc = sc
+        self.farming_contract = farming_contract
+        self.tokens = tokens
+        self.rows = []
+
+    def read(self, expression):
+        return int(self.sc.compute(expression))
+
+    def transfer_calls(self):
+        calls = sp.nat(0)
+        for token in self.tokens:
+            calls += token.data.transfer_calls
+        return self.read(calls)
+
+    def entry_size(self, farm_id, user):
+        data = self.farming_contract.data
+        return self.read(
+            sp.len(sp.pack(data.farm_states.get_opt(farm_id)))
+            + sp.len(sp.pack(data.farm_configs.get_opt(farm_id)))
+            + sp.len(sp.pack(data.ledger.get_opt((farm_id, user))))
+        )
+
+    def call(self, entrypoint, params, farm_id, sender, now, budget=None):
+        """Call `entrypoint` and record its cost, checked against the `budget`
+        row, which defaults to the entrypoint name."""
+        size_before = self.entry_size(farm_id, sender)
+        calls_before = self.transfer_calls()
+        getattr(self.farming_contract, entrypoint)(
+            params, _sender=sender, _now=sp.timestamp(now)
+        )
+        size_after = self.entry_size(farm_id, sender)
+        acc_size = self.read(
+            sp.len(
+                sp.pack(
+                    self.farming_contract.data.farm_states[farm_id].acc_reward_per_share
+                )
+            )
+        )
+        self.rows.append(
+            {
+                "entrypoint": entrypoint,
+                "budget": budget or entrypoint,
+                "farm_id": farm_id,
+                "now": now,
+                "operations": self.transfer_calls() - calls_before,
+                "storage_diff": size_after - size_before,
+                "acc_size": acc_size,
+            }
+        )
+
+    def write_report(self, path):
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(self.rows[0]))
+                writer.writeheader()
+                writer.writerows(self.rows)
+        else:
+            with open(path, "w") as f:
+                json.dump(self.rows, f, indent=2)
+
+    def over_budget(self, budgets):
+        failures = []
+        for row in self.rows:
+            budget = budgets.get(row["budget"], {})
+            for metric in METRICS:
+                if metric in budget and row[metric] > budget[metric]:
+                    failures.append(
+                        "%s (farm %d, t=%d): %s %d > %d"
+                        % (
+                            row["budget"],
+                            row["farm_id"],
+                            row["now"],
+                            metric,
+                            row[metric],
+                            budget[metric],
+                        )
+                    )
+        return failures
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    budgets = dict(BUDGETS)
+    if args.budgets:
+        with open(args.budgets) as f:
+            budgets.update(json.load(f))
+    # Test accounts have valid addresses, which `sp.pack` requires
+    admin = sp.test_account("Admin").address
+    users = [sp.test_account("User%d" % i).address for i in range(args.users)]
+
+    @sp.add_test()
+    def test():
+        sc = sp.test_scenario(
+            SCENARIO_NAME,
+            [
+                farming_types,
+                sp.utils,
+                fa2_fungible,
+                fa2_counting,
+                farming_contract_module,
+            ],
+        )
+
+        sc.h1("Setup")
+        token = fa2_counting.CountingFa2Fungible(
+            administrator=admin,
+            metadata=sp.scenario_utils.metadata_of_url("https://token.com"),
+        )
+        sc += token
+        reward_token = fa2_counting.CountingFa2Fungible(
+            administrator=admin,
+            metadata=sp.scenario_utils.metadata_of_url("https://reward_token.com"),
+        )
+        sc += reward_token
+        farming_contract = farming_contract_module.FarmingContract(
+            administrator=admin,
+            metadata=sp.scenario_utils.metadata_of_url("https://example.com"),
+        )
+        sc += farming_contract
+
+        for contract in [token, reward_token]:
+            contract.mint(
+                sp.record(
+                    amount=sp.nat(1_000_000_000_000_000),
+                    to_=admin,
+                    token=sp.variant("new", {"0": sp.bytes("0x746f6b656e30")}),
+                ),
+                _sender=admin,
+            )
+        for user in users:
+            token.mint(
+                sp.record(
+                    amount=sp.nat(1_000_000_000_000),
+                    to_=user,
+                    token=sp.variant("existing", sp.nat(0)),
+                ),
+                _sender=admin,
+            )
+        for owner in [admin] + users:
+            for contract in [token, reward_token]:
+                contract.update_operators(
+                    [
+                        sp.variant(
+                            "add_operator",
+                            sp.record(
+                                owner=owner,
+                                operator=farming_contract.address,
+                                token_id=0,
+                            ),
+                        )
+                    ],
+                    _sender=owner,
+                )
+
+        bench = Bench(sc, farming_contract, [token, reward_token])
+        start_time = 1
+        end_time = start_time + 4 * args.elapsed
+
+        def farm_params(start_time, end_time, reward_supply, precision=None):
+            return sp.record(
+                pool_token=sp.record(
+                    address=token.address,
+                    token_id=sp.nat(0),
+                    token_type=sp.variant.fa2(()),
+                ),
+                reward_token=sp.record(
+                    address=reward_token.address,
+                    token_id=sp.nat(0),
+                    token_type=sp.variant.fa2(()),
+                ),
+                reward_supply=sp.nat(reward_supply),
+                start_time=sp.timestamp(start_time),
+                end_time=sp.timestamp(end_time),
+                lock_duration=sp.nat(0),
+                payout_threshold=None,
+                precision=None if precision is None else sp.Some(sp.nat(precision)),
+                bonuses=set(),
+            )
+
+        sc.h1("Create Farms")
+        for farm_id in range(args.farms):
+            bench.call(
+                "createFarm",
+                farm_params(start_time, end_time, 1_000_000_000_000),
+                farm_id,
+                admin,
+                0,
+            )
+
+        # Every user goes through the same timeline on every farm
+        timeline = [
+            ("deposit", start_time, lambda f: sp.record(farm_id=f, token_amount=1_000)),
+            (
+                "deposit",
+                start_time + args.elapsed,
+                lambda f: sp.record(farm_id=f, token_amount=1_000),
+            ),
+            ("harvest", start_time + 2 * args.elapsed, lambda f: sp.nat(f)),
+            (
+                "withdraw",
+                start_time + 3 * args.elapsed,
+                lambda f: sp.record(farm_id=f, token_amount=1_000),
+            ),
+            (
+                "withdraw",
+                end_time + 1,
+                lambda f: sp.record(farm_id=f, token_amount=1_000),
+            ),
+        ]
+        for entrypoint, now, make_params in timeline:
+            sc.h1("%s at %d" % (entrypoint, now))
+            for farm_id in range(args.farms):
+                for user in users:
+                    bench.call(
+                        entrypoint,
+                        make_params(farm_id),
+                        farm_id,
+                        user,
+                        now,
+                    )
+
+        sc.h1("End Farms")
+        for farm_id in range(args.farms):
+            bench.call(
+                "endFarm",
+                sp.nat(farm_id),
+                farm_id,
+                admin,
+                end_time + 2,
+            )
+
+        if args.years:
+            sc.h1("Long Running Farm")
+            farm_id = args.farms
+            lifetime_start = end_time + 10
+            lifetime_end = lifetime_start + args.years * 365 * 86_400
+            bench.call(
+                "createFarm",
+                farm_params(
+                    lifetime_start, lifetime_end, 100_000_000_000_000, args.precision
+                ),
+                farm_id,
+                admin,
+                end_time + 2,
+            )
+            bench.call(
+                "deposit",
+                sp.record(farm_id=farm_id, token_amount=1),
+                farm_id,
+                users[0],
+                lifetime_start,
+            )
+            for now in range(lifetime_start + MONTH, lifetime_end, MONTH):
+                bench.call(
+                    "harvest",
+                    sp.nat(farm_id),
+                    farm_id,
+                    users[0],
+                    now,
+                    "harvest_first" if now == lifetime_start + MONTH else None,
+                )
+
+        bench.write_report(args.report)
+        failures = bench.over_budget(budgets)
+        if failures:
+            raise Exception("Over budget:\n" + "\n".join(failures))
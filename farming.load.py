@@ -0,0 +1,358 @@
+import argparse
+import collections
+import csv
+import json
+import random
+import time
+import smartpy as sp  # type: ignore
+from farming import farming_contract_module
+from farming_contract_types import farming_types
+from utilities.fa2_fungible_minimal import fa2_fungible
+from utilities.fa2_fungible_counting import fa2_counting
+
+# Load test of the farming contract with a large population of stakers.
+#
+# A seeded generator draws a random but reproducible timeline of createFarm,
+# deposit, harvest, withdraw and endFarm calls from `--users` users over
+# `--farms` concurrent farms. It keeps a model of the farm pools to only draw
+# valid calls. The timeline is run through a SmartPy scenario, and after
+# each step the touched farm is checked against the model:
+#   - the pool balance is the sum of the modeled deposits,
+#   - the ledger amount of the sender matches the model,
+#   - `reward_paid` never exceeds `reward_supply`.
+# Every `--check-every` steps and at the end, the sum of the ledger amounts of
+# every farm is checked against its pool balance, and the token balances of
+# the contract against the pools and the unpaid reward supplies.
+#
+# Each step reports its wall time and the operations it emitted, counted by the
+# token contracts and read with `sc.compute`.
+#
+# Usage:
+#   python farming.load.py --users 1000 --farms 5 --steps 5000 --seed 1 \
+#       --report load_report.csv
+
+SCENARIO_NAME = "FarmingContractLoad"
+
+# Relative weights of the generated calls, among the valid ones
+WEIGHTS = {
+    "createFarm": 1,
+    "deposit": 10,
+    "harvest": 6,
+    "withdraw": 6,
+    "endFarm": 1,
+}
+
+REWARD_SUPPLY = 1_000_000_000_000
+USER_BALANCE = 1_000_000_000_000
+MAX_DEPOSIT = 1_000_000
+MINT_BATCH_SIZE = 500
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Farming contract load test")
+    parser.add_argument("--users", type=int, default=100, help="Number of stakers")
+    parser.add_argument(
+        "--farms", type=int, default=3, help="Maximum number of running farms"
+    )
+    parser.add_argument("--steps", type=int, default=500, help="Number of calls")
+    parser.add_argument("--seed", type=int, default=0, help="Timeline seed")
+    parser.add_argument(
+        "--step-seconds", type=int, default=600, help="Maximum time between calls"
+    )
+    parser.add_argument(
+        "--check-every", type=int, default=100, help="Steps between full checks"
+    )
+    parser.add_argument(
+        "--report", default="load_report.json", help="Report path (.json or .csv)"
+    )
+    return parser.parse_args()
+
+
+Step = collections.namedtuple("Step", "entrypoint farm_id user amount now")
+
+
+class FarmModel:
+    """Deposits of a farm, as expected from the generated calls."""
+
+    def __init__(self, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.deposits = {}
+        self.ended = False
+
+    @property
+    def pool_balance(self):
+        return sum(self.deposits.values())
+
+
+def generate_steps(rng, users, farms, steps, step_seconds):
+    """Return `steps` valid calls and the farm models after the last one.
+
+    `user` is a user index, `None` for the calls sent by the administrator.
+    """
+    models = []
+    timeline = []
+    now = 0
+    while len(timeline) < steps:
+        now += rng.randint(1, step_seconds)
+        running = [m for m in models if not m.ended]
+        started = [
+            farm_id
+            for farm_id, model in enumerate(models)
+            if not model.ended and model.start_time <= now
+        ]
+        open_farms = [f for f in started if now <= models[f].end_time]
+        staked = [f for f in started if models[f].deposits]
+        endable = [
+            farm_id
+            for farm_id, model in enumerate(models)
+            if not model.ended and not model.deposits and model.end_time < now
+        ]
+        choices = {
+            "createFarm": len(running) < farms,
+            "deposit": bool(open_farms),
+            "harvest": bool(staked),
+            "withdraw": bool(staked),
+            "endFarm": bool(endable),
+        }
+        entrypoints = [e for e, valid in choices.items() if valid]
+        if not entrypoints:
+            continue
+        entrypoint = rng.choices(entrypoints, [WEIGHTS[e] for e in entrypoints])[0]
+        if entrypoint == "createFarm":
+            start_time = now + rng.randint(0, 5 * step_seconds)
+            end_time = start_time + rng.randint(50, 500) * step_seconds
+            models.append(FarmModel(start_time, end_time))
+            timeline.append(Step(entrypoint, len(models) - 1, None, 0, now))
+        elif entrypoint == "deposit":
+            farm_id = rng.choice(open_farms)
+            user = rng.randrange(users)
+            amount = rng.randint(1, MAX_DEPOSIT)
+            deposits = models[farm_id].deposits
+            deposits[user] = deposits.get(user, 0) + amount
+            timeline.append(Step(entrypoint, farm_id, user, amount, now))
+        elif entrypoint == "harvest":
+            farm_id = rng.choice(staked)
+            user = rng.choice(sorted(models[farm_id].deposits))
+            timeline.append(Step(entrypoint, farm_id, user, 0, now))
+        elif entrypoint == "withdraw":
+            # Stakers of finished farms leave first
+            finished = [f for f in staked if models[f].end_time < now]
+            farm_id = rng.choice(finished or staked)
+            deposits = models[farm_id].deposits
+            user = rng.choice(sorted(deposits))
+            amount = deposits[user]
+            if not finished and rng.random() < 0.5:
+                amount = rng.randint(1, amount)
+            deposits[user] -= amount
+            if deposits[user] == 0:
+                del deposits[user]
+            timeline.append(Step(entrypoint, farm_id, user, amount, now))
+        else:
+            farm_id = rng.choice(endable)
+            models[farm_id].ended = True
+            timeline.append(Step(entrypoint, farm_id, None, 0, now))
+    return timeline, models
+
+
+def write_report(rows, path):
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+def summary(rows):
+    by_entrypoint = collections.defaultdict(list)
+    for row in rows:
+        by_entrypoint[row["entrypoint"]].append(row)
+    lines = []
+    for entrypoint, calls in sorted(by_entrypoint.items()):
+        seconds = [row["seconds"] for row in calls]
+        lines.append(
+            "%-10s calls %6d  mean %.4fs  max %.4fs  max operations %d"
+            % (
+                entrypoint,
+                len(calls),
+                sum(seconds) / len(seconds),
+                max(seconds),
+                max(row["operations"] for row in calls),
+            )
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    timeline, models = generate_steps(
+        random.Random(args.seed), args.users, args.farms, args.steps, args.step_seconds
+    )
+    admin = sp.test_account("Admin").address
+    users = [sp.test_account("User%d" % i).address for i in range(args.users)]
+
+    @sp.add_test()
+    def test():
+        sc = sp.test_scenario(
+            SCENARIO_NAME,
+            [
+                farming_types,
+                sp.utils,
+                fa2_fungible,
+                fa2_counting,
+                farming_contract_module,
+            ],
+        )
+
+        sc.h1("Setup")
+        token = fa2_counting.CountingFa2Fungible(
+            administrator=admin,
+            metadata=sp.scenario_utils.metadata_of_url("https://token.com"),
+        )
+        sc += token
+        reward_token = fa2_counting.CountingFa2Fungible(
+            administrator=admin,
+            metadata=sp.scenario_utils.metadata_of_url("https://reward_token.com"),
+        )
+        sc += reward_token
+        farming_contract = farming_contract_module.FarmingContract(
+            administrator=admin,
+            metadata=sp.scenario_utils.metadata_of_url("https://example.com"),
+        )
+        sc += farming_contract
+
+        for contract in [token, reward_token]:
+            contract.mint(
+                sp.record(
+                    amount=sp.nat(REWARD_SUPPLY * args.steps),
+                    to_=admin,
+                    token=sp.variant("new", {"0": sp.bytes("0x746f6b656e30")}),
+                ),
+                _sender=admin,
+            )
+        for start in range(0, len(users), MINT_BATCH_SIZE):
+            token.mint_batch(
+                [
+                    sp.record(to_=user, token_id=0, amount=USER_BALANCE)
+                    for user in users[start : start + MINT_BATCH_SIZE]
+                ],
+                _sender=admin,
+            )
+        for owner in [admin] + users:
+            for contract in [token, reward_token]:
+                contract.update_operators(
+                    [
+                        sp.variant(
+                            "add_operator",
+                            sp.record(
+                                owner=owner,
+                                operator=farming_contract.address,
+                                token_id=0,
+                            ),
+                        )
+                    ],
+                    _sender=owner,
+                )
+
+        data = farming_contract.data
+        expected = [FarmModel(model.start_time, model.end_time) for model in models]
+
+        def full_check():
+            for farm_id, model in enumerate(expected[:created]):
+                ledger_sum = sp.nat(0)
+                for user, amount in model.deposits.items():
+                    ledger_sum += data.ledger[(farm_id, users[user])].amount
+                sc.verify(ledger_sum == data.farm_states[farm_id].pool_balance)
+            pool_balances = sp.nat(0)
+            unpaid_rewards = sp.nat(0)
+            for farm_id, model in enumerate(expected[:created]):
+                state = data.farm_states[farm_id]
+                pool_balances += state.pool_balance
+                if not model.ended:
+                    unpaid_rewards += sp.as_nat(state.reward_supply - state.reward_paid)
+            contract_balance = sp.record(owner=farming_contract.address, token_id=0)
+            sc.verify(token.get_balance(contract_balance) == pool_balances)
+            sc.verify(reward_token.get_balance(contract_balance) == unpaid_rewards)
+
+        def transfer_calls():
+            return int(
+                sc.compute(token.data.transfer_calls + reward_token.data.transfer_calls)
+            )
+
+        rows = []
+        created = 0
+        for index, step in enumerate(timeline):
+            model = expected[step.farm_id]
+            sender = admin if step.user is None else users[step.user]
+            if step.entrypoint == "createFarm":
+                params = sp.record(
+                    pool_token=sp.record(
+                        address=token.address,
+                        token_id=sp.nat(0),
+                        token_type=sp.variant.fa2(()),
+                    ),
+                    reward_token=sp.record(
+                        address=reward_token.address,
+                        token_id=sp.nat(0),
+                        token_type=sp.variant.fa2(()),
+                    ),
+                    reward_supply=sp.nat(REWARD_SUPPLY),
+                    start_time=sp.timestamp(model.start_time),
+                    end_time=sp.timestamp(model.end_time),
+                    lock_duration=sp.nat(0),
+                    payout_threshold=None,
+                    precision=None,
+                    bonuses=set(),
+                )
+                created += 1
+            elif step.entrypoint in ["deposit", "withdraw"]:
+                params = sp.record(farm_id=step.farm_id, token_amount=step.amount)
+                deposits = model.deposits
+                if step.entrypoint == "deposit":
+                    deposits[step.user] = deposits.get(step.user, 0) + step.amount
+                else:
+                    deposits[step.user] -= step.amount
+                    if deposits[step.user] == 0:
+                        del deposits[step.user]
+            else:
+                params = sp.nat(step.farm_id)
+                if step.entrypoint == "endFarm":
+                    model.ended = True
+
+            sc.h2("%d: %s on farm %d" % (index, step.entrypoint, step.farm_id))
+            calls_before = transfer_calls()
+            started = time.perf_counter()
+            getattr(farming_contract, step.entrypoint)(
+                params, _sender=sender, _now=sp.timestamp(step.now)
+            )
+            seconds = time.perf_counter() - started
+            rows.append(
+                {
+                    "step": index,
+                    "entrypoint": step.entrypoint,
+                    "farm_id": step.farm_id,
+                    "user": "" if step.user is None else step.user,
+                    "now": step.now,
+                    "seconds": round(seconds, 6),
+                    "operations": transfer_calls() - calls_before,
+                }
+            )
+
+            state = data.farm_states[step.farm_id]
+            sc.verify(state.pool_balance == model.pool_balance)
+            sc.verify(state.reward_paid <= state.reward_supply)
+            if step.user is not None:
+                key = (step.farm_id, sender)
+                if step.user in model.deposits:
+                    sc.verify(data.ledger[key].amount == model.deposits[step.user])
+                else:
+                    sc.verify(~data.ledger.contains(key))
+            if (index + 1) % args.check_every == 0:
+                full_check()
+
+        full_check()
+        write_report(rows, args.report)
+        print(summary(rows))
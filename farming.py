@@ -6,73 +6,225 @@ from utilities.fa2_fungible_minimal import fa2_fungible
 
 @sp.module
 def farming_contract_module():
+    # Default precision of the reward accumulators
     DECIMAL = 1_000_000_000_000
+    # Version of the event payloads
+    EVENT_VERSION = 8
+    # Maximum number of reward streams added to a farm
+    MAX_REWARD_STREAMS = 4
 
-    # Transfer FA2 token function
-    @sp.effects(with_storage="read-only", with_operations=True)
-    def transfer_fa2_token(params):
-        sp.cast(params, farming_types.transfer_fa2_token_params_type)
-        if params.token_amount > 0:
+    # Queue a FA2 token transfer into the pending transfers
+    def queue_fa2_token(params):
+        sp.cast(
+            params,
+            sp.record(
+                transfers=farming_types.pending_transfers_type,
+                transfer=farming_types.transfer_fa2_token_params_type,
+            ),
+        )
+        transfers = params.transfers
+        if params.transfer.token_amount > 0:
+            txs = transfers.fa2.get(params.transfer.token_address, default={})
+            tx_key = sp.record(
+                from_=params.transfer.from_address,
+                to_=params.transfer.to_address,
+                token_id=params.transfer.token_id,
+            )
+            txs[tx_key] = txs.get(tx_key, default=0) + params.transfer.token_amount
+            transfers.fa2[params.transfer.token_address] = txs
+        return transfers
+
+    # Queue a FA12 token transfer into the pending transfers
+    def queue_fa12_token(params):
+        sp.cast(
+            params,
+            sp.record(
+                transfers=farming_types.pending_transfers_type,
+                transfer=farming_types.transfer_fa12_token_params_type,
+            ),
+        )
+        transfers = params.transfers
+        if params.transfer.token_amount > 0:
+            tx_key = sp.record(
+                token_address=params.transfer.token_address,
+                from_=params.transfer.from_address,
+                to_=params.transfer.to_address,
+            )
+            transfers.fa12[tx_key] = (
+                transfers.fa12.get(tx_key, default=0) + params.transfer.token_amount
+            )
+        return transfers
+
+    # Queue a FA12 or FA2 token transfer into the pending transfers
+    def queue_token_transfer(params):
+        sp.cast(
+            params,
+            sp.record(
+                transfers=farming_types.pending_transfers_type,
+                token=farming_types.token_type,
+                token_amount=sp.nat,
+                from_address=sp.address,
+                to_address=sp.address,
+            ),
+        )
+        transfers = params.transfers
+        with sp.match(params.token.token_type):
+            with sp.case.fa12 as data:
+                assert data == ()
+                trasfer_params = sp.record(
+                    token_address=params.token.address,
+                    token_amount=params.token_amount,
+                    from_address=params.from_address,
+                    to_address=params.to_address,
+                )
+                transfers = queue_fa12_token(
+                    sp.record(transfers=transfers, transfer=trasfer_params)
+                )
+            with sp.case.fa2 as data:
+                assert data == ()
+                trasfer_params = sp.record(
+                    token_address=params.token.address,
+                    token_id=params.token.token_id,
+                    token_amount=params.token_amount,
+                    from_address=params.from_address,
+                    to_address=params.to_address,
+                )
+                transfers = queue_fa2_token(
+                    sp.record(transfers=transfers, transfer=trasfer_params)
+                )
+        return transfers
+
+    # Send the pending transfers, one FA2 batch per token contract
+    @sp.effects(with_operations=True)
+    def send_transfers(transfers):
+        sp.cast(transfers, farming_types.pending_transfers_type)
+        for fa2_transfer in transfers.fa2.items():
+            # Keys are sorted by `from_`, so txs of the same sender are adjacent
+            batch = []
+            txs = []
+            from_address = sp.cast(None, sp.option[sp.address])
+            for tx in fa2_transfer.value.items():
+                if from_address != sp.Some(tx.key.from_):
+                    if from_address.is_some():
+                        batch.push(sp.record(from_=from_address.unwrap_some(), txs=txs))
+                    txs = []
+                    from_address = sp.Some(tx.key.from_)
+                txs.push(
+                    sp.record(to_=tx.key.to_, amount=tx.value, token_id=tx.key.token_id)
+                )
+                sp.trace(("Transfer Done", tx.value, ("To", tx.key.to_)))
+            batch.push(sp.record(from_=from_address.unwrap_some(), txs=txs))
             contractParams = sp.contract(
                 farming_types.transfer_params_type,
-                params.token_address,
+                fa2_transfer.key,
                 "transfer",
             ).unwrap_some()
-            dataToBeSent = sp.cast(
-                [
-                    sp.record(
-                        from_=params.from_address,
-                        txs=[
-                            sp.record(
-                                to_=params.to_address,
-                                amount=params.token_amount,
-                                token_id=params.token_id,
-                            )
-                        ],
-                    )
-                ],
-                farming_types.transfer_params_type,
-            )
+            dataToBeSent = sp.cast(batch, farming_types.transfer_params_type)
             sp.transfer(dataToBeSent, sp.mutez(0), contractParams)
-            sp.trace(("Transfer Done", params.token_amount, ("To", params.to_address)))
-
-    # Transfer FA12 token function
-    @sp.effects(with_storage="read-only", with_operations=True)
-    def transfer_fa12_token(params):
-        sp.cast(params, farming_types.transfer_fa12_token_params_type)
-        if params.token_amount > 0:
+        for fa12_transfer in transfers.fa12.items():
             contractParams = sp.contract(
                 farming_types.transfer_fa12_params_type,
-                params.token_address,
+                fa12_transfer.key.token_address,
                 "transfer",
             ).unwrap_some()
             dataToBeSent = sp.cast(
                 sp.record(
-                    from_=params.from_address,
-                    to_=params.to_address,
-                    value=params.token_amount,
+                    from_=fa12_transfer.key.from_,
+                    to_=fa12_transfer.key.to_,
+                    value=fa12_transfer.value,
                 ),
                 farming_types.transfer_fa12_params_type,
             )
             sp.transfer(dataToBeSent, sp.mutez(0), contractParams)
 
-    # Calculate the pending rewards
+    # Weighted time from the start of the farm to `time`, which falls within
+    # `epoch`
+    def weight_at(params):
+        sp.cast(
+            params, sp.record(epoch=farming_types.farm_epoch_type, time=sp.timestamp)
+        )
+        return sp.as_nat(
+            params.epoch.cumulative_weight
+            - sp.as_nat(params.epoch.end_time - params.time) * params.epoch.multiplier
+        )
+
+    # Accrue the farm rewards up to now. The weighted time elapsed since the
+    # last accrual is the difference of the cumulative weights at both ends,
+    # the epoch holding the accrual end is found by a binary search over the
+    # epochs left.
     @sp.effects(with_storage="read-only")
+    def accrue_rewards(params):
+        sp.cast(params, sp.record(farm_id=sp.nat, farm=farming_types.farm_state_type))
+        farm = params.farm
+        accrue_until = sp.now
+        if sp.now >= farm.end_time:
+            accrue_until = farm.end_time
+        weighted_time = sp.nat(0)
+        if farm.last_reward_time < accrue_until:
+            elapsed_weight = weight_at(
+                sp.record(epoch=farm.epoch, time=farm.last_reward_time)
+            )
+            if farm.epoch.end_time < accrue_until:
+                low = farm.epoch.index + 1
+                high = farm.last_epoch_index
+                while low < high:
+                    middle = (low + high) / 2
+                    if (
+                        self.data.farm_epochs[(params.farm_id, middle)].end_time
+                        < accrue_until
+                    ):
+                        low = middle + 1
+                    else:
+                        high = middle
+                farm.epoch = self.data.farm_epochs[(params.farm_id, low)]
+            weighted_time = sp.as_nat(
+                weight_at(sp.record(epoch=farm.epoch, time=accrue_until))
+                - elapsed_weight
+            )
+            farm.last_reward_time = accrue_until
+        sp.trace(("Weighted Elapsed Time", weighted_time))
+        if weighted_time > 0 and farm.pool_balance > 0:
+            reward_accured = weighted_time * farm.reward_per_second
+            farm.acc_reward_per_share += (
+                reward_accured * farm.precision
+            ) / farm.pool_balance
+            sp.trace(("Reward Accured", reward_accured))
+            sp.trace(("Acc_Reward_Per_Share", farm.acc_reward_per_share))
+            for stream_id in farm.streams.keys():
+                stream = farm.streams[stream_id]
+                stream.acc_reward_per_share += (
+                    weighted_time * stream.reward_per_second * farm.precision
+                ) / farm.pool_balance
+                farm.streams[stream_id] = stream
+        return farm
+
+    # Weighted time left between the last accrual and the end of the farm
+    @sp.effects(with_storage="read-only")
+    def remaining_weight(params):
+        sp.cast(params, sp.record(farm_id=sp.nat, farm=farming_types.farm_state_type))
+        farm = params.farm
+        last_epoch = self.data.farm_epochs[(params.farm_id, farm.last_epoch_index)]
+        return sp.as_nat(
+            last_epoch.cumulative_weight
+            - weight_at(sp.record(epoch=farm.epoch, time=farm.last_reward_time))
+        )
+
+    # Calculate the pending rewards
     def calculate_pending_rewards(params):
-        sp.cast(params, sp.record(farm_id=sp.nat, user=sp.address))
-        if (
-            self.data.farms[params.farm_id].reward_supply
-            > self.data.farms[params.farm_id].reward_paid
-        ):
+        sp.cast(
+            params,
+            sp.record(
+                farm=farming_types.farm_state_type,
+                position=farming_types.ledger_value_type,
+            ),
+        )
+        if params.farm.reward_supply > params.farm.reward_paid:
             pending_rewards = (
-                self.data.ledger[(params.farm_id, params.user)].amount
-                * self.data.farms[params.farm_id].acc_reward_per_share
-                / DECIMAL
-            ) - self.data.ledger[(params.farm_id, params.user)].reward_debt
-            available_rewards = (
-                self.data.farms[params.farm_id].reward_supply
-                - self.data.farms[params.farm_id].reward_paid
-            )
+                params.position.amount
+                * params.farm.acc_reward_per_share
+                / params.farm.precision
+            ) - params.position.reward_debt
+            available_rewards = params.farm.reward_supply - params.farm.reward_paid
             sp.trace(("Pending Rewards", pending_rewards))
             sp.trace(("Avlable Rewards", available_rewards))
             if pending_rewards > available_rewards:
@@ -82,81 +234,599 @@ def farming_contract_module():
         else:
             return sp.nat(0)
 
-    # Harvest tokens from farm
-    @sp.effects(with_storage="read-write", with_operations=True)
-    def harvest_rewards(params):
+    # Calculate the pending rewards of a user as if the farm was accrued now
+    @sp.effects(with_storage="read-only")
+    def project_pending_rewards(params):
         sp.cast(params, sp.record(farm_id=sp.nat, user=sp.address))
-        assert self.data.farms.contains(params.farm_id), "FarmNotFound"
-        assert self.data.ledger.contains(
-            (params.farm_id, params.user)
-        ), "DepositsNotFound"
-        assert self.data.farms[params.farm_id].start_time <= sp.now, "FarmNotStarted"
-        assert (
-            self.data.ledger[(params.farm_id, params.user)].amount > 0
-        ), "DepositsNotFound"
-        elasped_time = sp.nat(0)
-        if sp.now >= self.data.farms[params.farm_id].end_time:
-            elasped_time = sp.as_nat(
-                self.data.farms[params.farm_id].end_time
-                - self.data.farms[params.farm_id].last_reward_time
-            )
-            self.data.farms[params.farm_id].last_reward_time = self.data.farms[
-                params.farm_id
-            ].end_time
-        else:
-            elasped_time = sp.as_nat(
-                sp.now - self.data.farms[params.farm_id].last_reward_time
-            )
-            self.data.farms[params.farm_id].last_reward_time = sp.now
-        sp.trace(("Elapsed Time", elasped_time))
-        if elasped_time > 0:
-            reward_accured = (
-                elasped_time * self.data.farms[params.farm_id].reward_per_second
-            )
-            self.data.farms[params.farm_id].acc_reward_per_share += (
-                reward_accured * DECIMAL
-            ) / self.data.farms[params.farm_id].pool_balance
-            sp.trace(("Reward Accured", reward_accured))
-            sp.trace(
-                (
-                    "Acc_Reward_Per_Share",
-                    self.data.farms[params.farm_id].acc_reward_per_share,
+        farm = self.data.farm_states.get(params.farm_id, error="FarmNotFound")
+        position = self.data.ledger.get_opt((params.farm_id, params.user))
+        if position.is_some() and farm.start_time <= sp.now:
+            return position.unwrap_some().unclaimed + calculate_pending_rewards(
+                sp.record(
+                    farm=accrue_rewards(sp.record(farm_id=params.farm_id, farm=farm)),
+                    position=position.unwrap_some(),
                 )
             )
-        user_reward = calculate_pending_rewards(
-            sp.record(farm_id=params.farm_id, user=params.user)
+        else:
+            return sp.nat(0)
+
+    # Farm state published in the events
+    def farm_event_state(farm):
+        sp.cast(farm, farming_types.farm_state_type)
+        streams = sp.cast({}, sp.map[sp.nat, farming_types.stream_event_state_type])
+        for stream_id in farm.streams.keys():
+            streams[stream_id] = sp.record(
+                reward_paid=farm.streams[stream_id].reward_paid,
+                acc_reward_per_share=farm.streams[stream_id].acc_reward_per_share,
+            )
+        return sp.record(
+            pool_balance=farm.pool_balance,
+            reward_paid=farm.reward_paid,
+            acc_reward_per_share=farm.acc_reward_per_share,
+            last_reward_time=farm.last_reward_time,
+            streams=streams,
+        )
+
+    # Set the reward debts of a position to the accumulated rewards of its amount
+    def update_reward_debts(params):
+        sp.cast(
+            params,
+            sp.record(
+                farm=farming_types.farm_state_type,
+                position=farming_types.ledger_value_type,
+            ),
+        )
+        position = params.position
+        position.reward_debt = (
+            params.farm.acc_reward_per_share * position.amount / params.farm.precision
         )
+        for stream_id in params.farm.streams.keys():
+            stream_position = position.streams.get(
+                stream_id, default=sp.record(reward_debt=0, unclaimed=0)
+            )
+            stream_position.reward_debt = (
+                params.farm.streams[stream_id].acc_reward_per_share
+                * position.amount
+                / params.farm.precision
+            )
+            position.streams[stream_id] = stream_position
+        return position
+
+    # Harvest the reward streams of an accrued farm into the unclaimed rewards
+    # of the position, and pay them out when `claim` is set. `rewards` holds
+    # the amounts paid out of each stream.
+    def harvest_streams(params):
+        sp.cast(
+            params,
+            sp.record(
+                user=sp.address,
+                claim=sp.bool,
+                farm=farming_types.farm_state_type,
+                position=farming_types.ledger_value_type,
+                transfers=farming_types.pending_transfers_type,
+            ),
+        )
+        farm = params.farm
+        position = params.position
+        transfers = params.transfers
+        rewards = sp.cast({}, sp.map[sp.nat, sp.nat])
+        for stream_id in farm.streams.keys():
+            stream = farm.streams[stream_id]
+            stream_position = position.streams.get(
+                stream_id, default=sp.record(reward_debt=0, unclaimed=0)
+            )
+            stream_reward = sp.nat(0)
+            if stream.reward_supply > stream.reward_paid:
+                stream_reward = sp.as_nat(
+                    position.amount * stream.acc_reward_per_share / farm.precision
+                    - stream_position.reward_debt
+                )
+                if stream_reward > sp.as_nat(stream.reward_supply - stream.reward_paid):
+                    stream_reward = sp.as_nat(stream.reward_supply - stream.reward_paid)
+            stream.reward_paid += stream_reward
+            farm.streams[stream_id] = stream
+            stream_position.unclaimed += stream_reward
+            if params.claim and stream_position.unclaimed > 0:
+                transfers = queue_token_transfer(
+                    sp.record(
+                        transfers=transfers,
+                        token=stream.reward_token,
+                        token_amount=stream_position.unclaimed,
+                        from_address=sp.self_address(),
+                        to_address=params.user,
+                    )
+                )
+                rewards[stream_id] = stream_position.unclaimed
+                stream_position.unclaimed = 0
+            position.streams[stream_id] = stream_position
+        return sp.record(
+            farm=farm, position=position, transfers=transfers, rewards=rewards
+        )
+
+    # Harvest tokens from an accrued farm. The rewards are added to the unclaimed
+    # rewards of the position, which are paid out when `claim` is set, when the
+    # farm has no payout threshold or when they reach the threshold.
+    @sp.effects(with_operations=True)
+    def harvest_rewards(params):
+        sp.cast(
+            params,
+            sp.record(
+                farm_id=sp.nat,
+                user=sp.address,
+                claim=sp.bool,
+                farm=farming_types.farm_state_type,
+                position=farming_types.ledger_value_type,
+                transfers=farming_types.pending_transfers_type,
+            ),
+        )
+        farm = params.farm
+        position = params.position
+        transfers = params.transfers
+        user_reward = calculate_pending_rewards(sp.record(farm=farm, position=position))
         sp.trace(("User Rewards", user_reward))
-        with sp.match(self.data.farms[params.farm_id].reward_token.token_type):
-            with sp.case.fa12 as data:
-                assert data == ()
-                trasfer_params = sp.record(
-                    token_address=self.data.farms[params.farm_id].reward_token.address,
-                    token_amount=user_reward,
+        farm.reward_paid += user_reward
+        position.unclaimed += user_reward
+        claim = params.claim
+        if farm.payout_threshold.is_some():
+            if position.unclaimed >= farm.payout_threshold.unwrap_some():
+                claim = True
+        else:
+            claim = True
+        streams = harvest_streams(
+            sp.record(
+                user=params.user,
+                claim=claim,
+                farm=farm,
+                position=position,
+                transfers=transfers,
+            )
+        )
+        farm = streams.farm
+        transfers = streams.transfers
+        position = update_reward_debts(sp.record(farm=farm, position=streams.position))
+        paid_reward = sp.nat(0)
+        if claim:
+            paid_reward = position.unclaimed
+            position.unclaimed = 0
+            transfers = queue_token_transfer(
+                sp.record(
+                    transfers=transfers,
+                    token=farm.reward_token,
+                    token_amount=paid_reward,
                     from_address=sp.self_address(),
                     to_address=params.user,
                 )
-                transfer_fa12_token(trasfer_params)
-            with sp.case.fa2 as data:
-                assert data == ()
-                trasfer_params = sp.record(
-                    token_address=self.data.farms[params.farm_id].reward_token.address,
-                    token_id=self.data.farms[params.farm_id].reward_token.token_id,
-                    token_amount=user_reward,
+            )
+            sp.emit(
+                sp.cast(
+                    sp.record(
+                        version=EVENT_VERSION,
+                        farm_id=params.farm_id,
+                        user=params.user,
+                        reward=paid_reward,
+                        stream_rewards=streams.rewards,
+                        farm=farm_event_state(farm),
+                        position=position,
+                    ),
+                    farming_types.harvested_event_type,
+                ),
+                tag="Harvested",
+            )
+        return sp.record(
+            farm=farm,
+            position=position,
+            transfers=transfers,
+            reward=paid_reward,
+            stream_rewards=streams.rewards,
+        )
+
+    # Calculate the pending rewards of the reward streams of a user as if the
+    # farm was accrued now
+    @sp.effects(with_storage="read-only")
+    def project_pending_stream_rewards(params):
+        sp.cast(params, sp.record(farm_id=sp.nat, user=sp.address))
+        farm = self.data.farm_states.get(params.farm_id, error="FarmNotFound")
+        position = self.data.ledger.get_opt((params.farm_id, params.user))
+        rewards = sp.cast({}, sp.map[sp.nat, sp.nat])
+        if position.is_some() and farm.start_time <= sp.now:
+            streams = harvest_streams(
+                sp.record(
+                    user=params.user,
+                    claim=False,
+                    farm=accrue_rewards(sp.record(farm_id=params.farm_id, farm=farm)),
+                    position=position.unwrap_some(),
+                    transfers=sp.record(fa2={}, fa12={}),
+                )
+            )
+            for stream_id in streams.position.streams.keys():
+                rewards[stream_id] = streams.position.streams[stream_id].unclaimed
+        return rewards
+
+    # Deposit tokens of the sender to a farm, the transfers are queued
+    @sp.effects(with_storage="read-write", with_operations=True)
+    def deposit_tokens(params):
+        sp.cast(
+            params,
+            sp.record(
+                farm_id=sp.nat,
+                token_amount=sp.nat,
+                transfers=farming_types.pending_transfers_type,
+            ),
+        )
+        farm = self.data.farm_states.get(params.farm_id, error="FarmNotFound")
+        assert farm.start_time <= sp.now, "FarmNotStarted"
+        assert farm.end_time >= sp.now, "FarmEnded"
+        assert not farm.ended, "FarmEnded"
+        assert params.token_amount > 0, "InvalidAmount"
+        transfers = params.transfers
+        position = self.data.ledger.get(
+            (params.farm_id, sp.sender),
+            default=sp.record(
+                amount=0,
+                reward_debt=0,
+                lock_end_time=sp.now,
+                unclaimed=0,
+                streams={},
+            ),
+        )
+        farm = accrue_rewards(sp.record(farm_id=params.farm_id, farm=farm))
+        reward = sp.nat(0)
+        stream_rewards = sp.cast({}, sp.map[sp.nat, sp.nat])
+        if position.amount > 0:
+            harvest = harvest_rewards(
+                sp.record(
+                    farm_id=params.farm_id,
+                    user=sp.sender,
+                    claim=False,
+                    farm=farm,
+                    position=position,
+                    transfers=transfers,
+                )
+            )
+            farm = harvest.farm
+            position = harvest.position
+            transfers = harvest.transfers
+            reward = harvest.reward
+            stream_rewards = harvest.stream_rewards
+        transfers = queue_token_transfer(
+            sp.record(
+                transfers=transfers,
+                token=farm.pool_token,
+                token_amount=params.token_amount,
+                from_address=sp.sender,
+                to_address=sp.self_address(),
+            )
+        )
+        farm.pool_balance += params.token_amount
+        position.amount += params.token_amount
+        position = update_reward_debts(sp.record(farm=farm, position=position))
+        self.data.farm_states[params.farm_id] = farm
+        self.data.ledger[(params.farm_id, sp.sender)] = position
+        sp.trace(("Reward Balance", farm.reward_supply - farm.reward_paid))
+        sp.trace(("Pool Balance", farm.pool_balance))
+        sp.emit(
+            sp.cast(
+                sp.record(
+                    version=EVENT_VERSION,
+                    farm_id=params.farm_id,
+                    user=sp.sender,
+                    amount=params.token_amount,
+                    reward=reward,
+                    stream_rewards=stream_rewards,
+                    farm=farm_event_state(farm),
+                    position=position,
+                ),
+                farming_types.tokens_event_type,
+            ),
+            tag="TokensDeposited",
+        )
+        return transfers
+
+    # Withdraw tokens of the sender from a farm, the transfers are queued
+    @sp.effects(with_storage="read-write", with_operations=True)
+    def withdraw_tokens(params):
+        sp.cast(
+            params,
+            sp.record(
+                farm_id=sp.nat,
+                token_amount=sp.nat,
+                transfers=farming_types.pending_transfers_type,
+            ),
+        )
+        farm = self.data.farm_states.get(params.farm_id, error="FarmNotFound")
+        assert farm.start_time <= sp.now, "FarmNotStarted"
+        position = self.data.ledger.get((params.farm_id, sp.sender), error="NoDeposits")
+        assert position.amount >= params.token_amount, "InsufficientDeposits"
+        if farm.lock_duration > 0:
+            assert position.lock_end_time <= sp.now, "TokensLocked"
+        transfers = params.transfers
+        farm = accrue_rewards(sp.record(farm_id=params.farm_id, farm=farm))
+        reward = sp.nat(0)
+        stream_rewards = sp.cast({}, sp.map[sp.nat, sp.nat])
+        if position.amount > 0:
+            harvest = harvest_rewards(
+                sp.record(
+                    farm_id=params.farm_id,
+                    user=sp.sender,
+                    claim=position.amount == params.token_amount,
+                    farm=farm,
+                    position=position,
+                    transfers=transfers,
+                )
+            )
+            farm = harvest.farm
+            position = harvest.position
+            transfers = harvest.transfers
+            reward = harvest.reward
+            stream_rewards = harvest.stream_rewards
+        transfers = queue_token_transfer(
+            sp.record(
+                transfers=transfers,
+                token=farm.pool_token,
+                token_amount=params.token_amount,
+                from_address=sp.self_address(),
+                to_address=sp.sender,
+            )
+        )
+        farm.pool_balance = sp.as_nat(farm.pool_balance - params.token_amount)
+        position.amount = sp.as_nat(position.amount - params.token_amount)
+        position = update_reward_debts(sp.record(farm=farm, position=position))
+        self.data.farm_states[params.farm_id] = farm
+        if position.amount == 0:
+            del self.data.ledger[(params.farm_id, sp.sender)]
+        else:
+            self.data.ledger[(params.farm_id, sp.sender)] = position
+        sp.trace(("Reward Balance", farm.reward_supply - farm.reward_paid))
+        sp.trace(("Pool Balance", farm.pool_balance))
+        sp.emit(
+            sp.cast(
+                sp.record(
+                    version=EVENT_VERSION,
+                    farm_id=params.farm_id,
+                    user=sp.sender,
+                    amount=params.token_amount,
+                    reward=reward,
+                    stream_rewards=stream_rewards,
+                    farm=farm_event_state(farm),
+                    position=position,
+                ),
+                farming_types.tokens_event_type,
+            ),
+            tag="TokensWithdrawn",
+        )
+        return transfers
+
+    # Harvest the rewards of the sender from a farm, the transfers are queued
+    @sp.effects(with_storage="read-write", with_operations=True)
+    def harvest_tokens(params):
+        sp.cast(
+            params,
+            sp.record(farm_id=sp.nat, transfers=farming_types.pending_transfers_type),
+        )
+        transfers = params.transfers
+        position = self.data.ledger.get_opt((params.farm_id, sp.sender))
+        if position.is_some() and position.unwrap_some().amount > 0:
+            farm = self.data.farm_states.get(params.farm_id, error="FarmNotFound")
+            assert farm.start_time <= sp.now, "FarmNotStarted"
+            harvest = harvest_rewards(
+                sp.record(
+                    farm_id=params.farm_id,
+                    user=sp.sender,
+                    claim=True,
+                    farm=accrue_rewards(sp.record(farm_id=params.farm_id, farm=farm)),
+                    position=position.unwrap_some(),
+                    transfers=transfers,
+                )
+            )
+            farm = harvest.farm
+            self.data.farm_states[params.farm_id] = farm
+            self.data.ledger[(params.farm_id, sp.sender)] = harvest.position
+            transfers = harvest.transfers
+            sp.trace(("Reward Balance", farm.reward_supply - farm.reward_paid))
+            sp.trace(("Pool Balance", farm.pool_balance))
+        return transfers
+
+    # Withdraw the whole deposit of the sender without accruing nor paying the
+    # rewards, which are given up. Unclaimed rewards go back to the reward supply.
+    @sp.effects(with_storage="read-write", with_operations=True)
+    def emergency_withdraw_tokens(farm_id):
+        sp.cast(farm_id, sp.nat)
+        position = self.data.ledger.get((farm_id, sp.sender), error="NoDeposits")
+        farm = self.data.farm_states.get(farm_id, error="FarmNotFound")
+        if farm.lock_duration > 0:
+            assert position.lock_end_time <= sp.now, "TokensLocked"
+        farm.pool_balance = sp.as_nat(farm.pool_balance - position.amount)
+        farm.reward_paid = sp.as_nat(farm.reward_paid - position.unclaimed)
+        for stream_id in position.streams.keys():
+            stream = farm.streams[stream_id]
+            stream.reward_paid = sp.as_nat(
+                stream.reward_paid - position.streams[stream_id].unclaimed
+            )
+            farm.streams[stream_id] = stream
+        self.data.farm_states[farm_id] = farm
+        del self.data.ledger[(farm_id, sp.sender)]
+        send_transfers(
+            queue_token_transfer(
+                sp.record(
+                    transfers=sp.cast(
+                        sp.record(fa2={}, fa12={}),
+                        farming_types.pending_transfers_type,
+                    ),
+                    token=farm.pool_token,
+                    token_amount=position.amount,
                     from_address=sp.self_address(),
-                    to_address=params.user,
+                    to_address=sp.sender,
                 )
-                transfer_fa2_token(trasfer_params)
-        self.data.farms[params.farm_id].reward_paid += user_reward
-        self.data.ledger[(params.farm_id, params.user)].reward_debt += (
-            self.data.farms[params.farm_id].acc_reward_per_share
-            * self.data.ledger[(params.farm_id, params.user)].amount
-            / DECIMAL
+            )
+        )
+        sp.emit(
+            sp.cast(
+                sp.record(
+                    version=EVENT_VERSION,
+                    farm_id=farm_id,
+                    user=sp.sender,
+                    amount=position.amount,
+                    farm=farm_event_state(farm),
+                ),
+                farming_types.emergency_withdrawn_event_type,
+            ),
+            tag="EmergencyWithdrawn",
+        )
+
+    # End a farm of the sender without deposits, the rewards left go back to
+    # the farm owner and the stream owners. The farm is marked as ended so the
+    # rewards are only sent back once, and it takes no more deposits.
+    @sp.effects(with_storage="read-write", with_operations=True)
+    def end_farm(farm_id):
+        sp.cast(farm_id, sp.nat)
+        farm = self.data.farm_states.get(farm_id, error="FarmNotFound")
+        config = self.data.farm_configs[farm_id]
+        assert config.owner == sp.sender, "NotOwner"
+        assert not farm.ended, "FarmEnded"
+        assert farm.pool_balance == 0, "PoolBalanceNotZero"
+        farm.ended = True
+        self.data.farm_states[farm_id] = farm
+        transfers = sp.cast(
+            sp.record(fa2={}, fa12={}), farming_types.pending_transfers_type
+        )
+        transfers = queue_token_transfer(
+            sp.record(
+                transfers=transfers,
+                token=farm.reward_token,
+                token_amount=sp.as_nat(farm.reward_supply - farm.reward_paid),
+                from_address=sp.self_address(),
+                to_address=sp.sender,
+            )
         )
+        for stream_id in farm.streams.keys():
+            stream = farm.streams[stream_id]
+            transfers = queue_token_transfer(
+                sp.record(
+                    transfers=transfers,
+                    token=stream.reward_token,
+                    token_amount=sp.as_nat(stream.reward_supply - stream.reward_paid),
+                    from_address=sp.self_address(),
+                    to_address=config.streams[stream_id].owner,
+                )
+            )
+        send_transfers(transfers)
         sp.emit(
-            sp.record(farm_id=params.farm_id, user=params.user, reward=user_reward),
-            tag="Harvested",
+            sp.cast(
+                sp.record(version=EVENT_VERSION, farm_id=farm_id),
+                farming_types.farm_ended_event_type,
+            ),
+            tag="FarmEnded",
         )
+        return farm
+
+    # Hash a merkle tree node with its sibling. The hashes are combined in
+    # increasing order, so proofs do not need the position of the leaf.
+    def hash_merkle_pair(params):
+        sp.cast(params, sp.record(node=sp.bytes, sibling=sp.bytes))
+        if params.node < params.sibling:
+            return sp.blake2b(sp.concat([params.node, params.sibling]))
+        else:
+            return sp.blake2b(sp.concat([params.sibling, params.node]))
+
+    # Build the state, config and bonus epochs of a new farm
+    def build_farm(params):
+        sp.cast(
+            params,
+            sp.record(params=farming_types.create_farm_params_type, owner=sp.address),
+        )
+        farm_params = params.params
+        assert farm_params.end_time > farm_params.start_time, "InvalidFarmDuration"
+        precision = DECIMAL
+        if farm_params.precision.is_some():
+            precision = farm_params.precision.unwrap_some()
+        assert precision > 0, "InvalidPrecision"
+        # Split the farm duration into epochs, one per bonus period and one
+        # without bonus until the end of the farm. Each epoch keeps the
+        # weighted time elapsed from the start of the farm to its end.
+        epochs = sp.cast({}, sp.map[sp.nat, farming_types.farm_epoch_type])
+        epoch_index = sp.nat(0)
+        epoch_start = farm_params.start_time
+        cumulative_weight = sp.nat(0)
+        for bonus in farm_params.bonuses.elements():
+            assert bonus.multipier > 0, "InvalidBonus"
+            epoch_end = bonus.end_time
+            if farm_params.end_time < epoch_end:
+                epoch_end = farm_params.end_time
+            if epoch_start < epoch_end:
+                cumulative_weight += (
+                    sp.as_nat(epoch_end - epoch_start) * bonus.multipier
+                )
+                epochs[epoch_index] = sp.record(
+                    index=epoch_index,
+                    end_time=epoch_end,
+                    multiplier=bonus.multipier,
+                    cumulative_weight=cumulative_weight,
+                )
+                epoch_index += 1
+                epoch_start = epoch_end
+        if epoch_start < farm_params.end_time:
+            cumulative_weight += sp.as_nat(farm_params.end_time - epoch_start)
+            epochs[epoch_index] = sp.record(
+                index=epoch_index,
+                end_time=farm_params.end_time,
+                multiplier=1,
+                cumulative_weight=cumulative_weight,
+            )
+        state = sp.record(
+            pool_token=farm_params.pool_token,
+            reward_token=farm_params.reward_token,
+            lock_duration=farm_params.lock_duration,
+            payout_threshold=farm_params.payout_threshold,
+            pool_balance=0,
+            reward_supply=farm_params.reward_supply,
+            reward_paid=0,
+            last_reward_time=farm_params.start_time,
+            acc_reward_per_share=0,
+            reward_per_second=farm_params.reward_supply / cumulative_weight,
+            start_time=farm_params.start_time,
+            end_time=farm_params.end_time,
+            epoch=epochs[0],
+            last_epoch_index=sp.as_nat(sp.len(epochs) - 1),
+            streams={},
+            precision=precision,
+            ended=False,
+        )
+        config = sp.record(owner=params.owner, streams={})
+        return sp.record(
+            state=sp.cast(state, farming_types.farm_state_type),
+            config=sp.cast(config, farming_types.farm_config_type),
+            epochs=epochs,
+        )
+
+    # Load the full record of a farm from its state, config and bonuses
+    @sp.effects(with_storage="read-only")
+    def load_farm(farm_id):
+        sp.cast(farm_id, sp.nat)
+        farm = None
+        if self.data.farm_states.contains(farm_id):
+            state = self.data.farm_states[farm_id]
+            farm = sp.Some(
+                sp.record(
+                    pool_token=state.pool_token,
+                    pool_balance=state.pool_balance,
+                    reward_token=state.reward_token,
+                    reward_supply=state.reward_supply,
+                    reward_paid=state.reward_paid,
+                    last_reward_time=state.last_reward_time,
+                    acc_reward_per_share=state.acc_reward_per_share,
+                    precision=state.precision,
+                    reward_per_second=state.reward_per_second,
+                    start_time=state.start_time,
+                    end_time=state.end_time,
+                    lock_duration=state.lock_duration,
+                    payout_threshold=state.payout_threshold,
+                    bonuses=self.data.farm_bonuses.get(farm_id, default=set()),
+                    owner=self.data.farm_configs[farm_id].owner,
+                    streams=state.streams,
+                    ended=state.ended,
+                )
+            )
+        return sp.cast(farm, sp.option[farming_types.farm_type])
 
     class FarmingContract(sp.Contract):
         # intial storage
@@ -176,9 +846,31 @@ def farming_contract_module():
                 ),
                 farming_types.administration_panel_type,
             )
-            # Farms big_map to store all the farms data
-            self.data.farms = sp.cast(
-                sp.big_map(), sp.big_map[sp.nat, farming_types.farm_type]
+            # Farm states big_map to store the accrual data, updated on every call
+            self.data.farm_states = sp.cast(
+                sp.big_map(), sp.big_map[sp.nat, farming_types.farm_state_type]
+            )
+            # Farm configs big_map to store the data set at farm creation
+            self.data.farm_configs = sp.cast(
+                sp.big_map(), sp.big_map[sp.nat, farming_types.farm_config_type]
+            )
+            # Index of the active farm ids by pool token address and token id
+            self.data.pool_token_farms = sp.cast(
+                sp.big_map(),
+                sp.big_map[farming_types.pool_token_key_type, sp.set[sp.nat]],
+            )
+            # Farm epochs big_map to store the bonus schedule of the farms
+            self.data.farm_epochs = sp.cast(
+                sp.big_map(),
+                sp.big_map[sp.pair[sp.nat, sp.nat], farming_types.farm_epoch_type],
+            )
+            # Farm bonuses big_map to store the bonus periods of the farms
+            self.data.farm_bonuses = sp.cast(
+                sp.big_map(),
+                sp.big_map[
+                    sp.nat,
+                    sp.set[sp.record(end_time=sp.timestamp, multipier=sp.nat)],
+                ],
             )
             # Total farms count
             self.data.next_farm_id = sp.cast(0, sp.nat)
@@ -191,6 +883,16 @@ def farming_contract_module():
             )
             # Vaults to store all the user assets data
             self.data.vaults = sp.cast(sp.big_map(), sp.big_map[sp.address, sp.address])
+            # Distributions big_map to store the merkle roots of the reward drops
+            self.data.distributions = sp.cast(
+                sp.big_map(), sp.big_map[sp.nat, farming_types.distribution_type]
+            )
+            # Claimed distributions by distribution id and user
+            self.data.distribution_claims = sp.cast(
+                sp.big_map(), sp.big_map[sp.pair[sp.nat, sp.address], sp.unit]
+            )
+            # Total distributions count
+            self.data.next_distribution_id = sp.cast(0, sp.nat)
 
         # Check if the sender is the administrator
         @sp.private(with_storage="read-only")
@@ -235,298 +937,866 @@ def farming_contract_module():
         def createFarm(self, params):
             sp.cast(params, farming_types.create_farm_params_type)
             sp.trace(("Current Time", sp.now))
-            farm_id = self.data.next_farm_id
-            farm_duration = sp.as_nat(params.end_time - params.start_time)
-            self.data.farms[farm_id] = sp.record(
-                pool_token=params.pool_token,
-                pool_balance=0,
-                reward_token=params.reward_token,
-                reward_supply=params.reward_supply,
-                reward_paid=0,
-                last_reward_time=params.start_time,
-                acc_reward_per_share=0,
-                reward_per_second=(params.reward_supply) / farm_duration,
-                start_time=params.start_time,
-                end_time=params.end_time,
-                lock_duration=params.lock_duration,
-                bonuses=params.bonuses,
-                owner=sp.sender,
+            transfers = sp.cast(
+                sp.record(fa2={}, fa12={}), farming_types.pending_transfers_type
             )
+            farm_id = self.data.next_farm_id
+            new_farm = build_farm(sp.record(params=params, owner=sp.sender))
+            for epoch in new_farm.epochs.values():
+                self.data.farm_epochs[(farm_id, epoch.index)] = epoch
+            farm = new_farm.state
+            self.data.farm_states[farm_id] = farm
+            self.data.farm_configs[farm_id] = new_farm.config
+            if sp.len(params.bonuses) > 0:
+                self.data.farm_bonuses[farm_id] = params.bonuses
             self.data.next_farm_id += 1
-            with sp.match(params.reward_token.token_type):
-                with sp.case.fa12 as data:
-                    assert data == ()
-                    trasfer_params = sp.record(
-                        token_address=params.reward_token.address,
-                        token_amount=params.reward_supply,
-                        from_address=sp.sender,
-                        to_address=sp.self_address(),
-                    )
-                    transfer_fa12_token(trasfer_params)
-                with sp.case.fa2 as data:
-                    assert data == ()
-                    trasfer_params = sp.record(
-                        token_address=params.reward_token.address,
-                        token_id=params.reward_token.token_id,
-                        token_amount=params.reward_supply,
-                        from_address=sp.sender,
-                        to_address=sp.self_address(),
-                    )
-                    transfer_fa2_token(trasfer_params)
-            sp.trace(
-                (
-                    "Reward Balance",
-                    self.data.farms[farm_id].reward_supply
-                    - self.data.farms[farm_id].reward_paid,
+            pool_token_key = (params.pool_token.address, params.pool_token.token_id)
+            pool_token_farms = self.data.pool_token_farms.get(
+                pool_token_key, default=set()
+            )
+            pool_token_farms.add(farm_id)
+            self.data.pool_token_farms[pool_token_key] = pool_token_farms
+            transfers = queue_token_transfer(
+                sp.record(
+                    transfers=transfers,
+                    token=params.reward_token,
+                    token_amount=params.reward_supply,
+                    from_address=sp.sender,
+                    to_address=sp.self_address(),
                 )
             )
-            sp.trace(("Pool Balance", self.data.farms[farm_id].pool_balance))
+            sp.trace(("Reward Balance", farm.reward_supply - farm.reward_paid))
+            sp.trace(("Pool Balance", farm.pool_balance))
+            send_transfers(transfers)
             sp.trace("~~~~~~~~~~~~~~~ End of Txn ~~~~~~~~~~~~~~~~")
             sp.emit(
-                sp.record(farm_id=farm_id),
+                sp.cast(
+                    sp.record(
+                        version=EVENT_VERSION,
+                        farm_id=farm_id,
+                        pool_token=params.pool_token,
+                        reward_token=params.reward_token,
+                        reward_supply=params.reward_supply,
+                        reward_per_second=farm.reward_per_second,
+                        precision=farm.precision,
+                        start_time=params.start_time,
+                        end_time=params.end_time,
+                        lock_duration=params.lock_duration,
+                        payout_threshold=params.payout_threshold,
+                        owner=sp.sender,
+                    ),
+                    farming_types.farm_created_event_type,
+                ),
                 tag="FarmCreated",
             )
 
         # Deposit tokens to farm
         @sp.entrypoint
         def deposit(self, params):
-            sp.cast(params, farming_types.deposit_params_type)
+            sp.cast(params, farming_types.farm_amount_params_type)
             sp.trace(("Current Time", sp.now))
-            assert self.data.farms.contains(params.farm_id), "FarmNotFound"
-            farm = self.data.farms[params.farm_id]
-            assert farm.start_time <= sp.now, "FarmNotStarted"
-            assert farm.end_time >= sp.now, "FarmEnded"
-            assert params.token_amount > 0, "InvalidAmount"
-            if (
-                self.data.ledger.contains((params.farm_id, sp.sender))
-                and self.data.ledger[(params.farm_id, sp.sender)].amount > 0
-            ):
-                harvest_rewards(sp.record(farm_id=params.farm_id, user=sp.sender))
-            else:
-                elasped_time = sp.nat(0)
-                if sp.now >= self.data.farms[params.farm_id].end_time:
-                    elasped_time = sp.as_nat(
-                        self.data.farms[params.farm_id].end_time
-                        - self.data.farms[params.farm_id].last_reward_time
-                    )
-                    self.data.farms[params.farm_id].last_reward_time = self.data.farms[
-                        params.farm_id
-                    ].end_time
-                else:
-                    elasped_time = sp.as_nat(
-                        sp.now - self.data.farms[params.farm_id].last_reward_time
-                    )
-                    self.data.farms[params.farm_id].last_reward_time = sp.now
-                sp.trace(("Elapsed Time", elasped_time))
-                if (
-                    elasped_time > 0
-                    and self.data.farms[params.farm_id].pool_balance > 0
-                ):
-                    reward_accured = (
-                        elasped_time * self.data.farms[params.farm_id].reward_per_second
-                    )
-                    self.data.farms[params.farm_id].acc_reward_per_share += (
-                        reward_accured * DECIMAL
-                    ) / self.data.farms[params.farm_id].pool_balance
-                    sp.trace(("Reward Accured", reward_accured))
-                    sp.trace(
-                        (
-                            "Acc_Reward_Per_Share",
-                            self.data.farms[params.farm_id].acc_reward_per_share,
-                        )
-                    )
-            with sp.match(farm.pool_token.token_type):
-                with sp.case.fa12 as data:
-                    assert data == ()
-                    trasfer_params = sp.record(
-                        token_address=farm.pool_token.address,
-                        token_amount=params.token_amount,
-                        from_address=sp.sender,
-                        to_address=sp.self_address(),
-                    )
-                    transfer_fa12_token(trasfer_params)
-                with sp.case.fa2 as data:
-                    assert data == ()
-                    trasfer_params = sp.record(
-                        token_address=farm.pool_token.address,
-                        token_id=farm.pool_token.token_id,
+            send_transfers(
+                deposit_tokens(
+                    sp.record(
+                        farm_id=params.farm_id,
                         token_amount=params.token_amount,
-                        from_address=sp.sender,
-                        to_address=sp.self_address(),
+                        transfers=sp.record(fa2={}, fa12={}),
                     )
-                    transfer_fa2_token(trasfer_params)
-            self.data.farms[params.farm_id].pool_balance += params.token_amount
-            if self.data.ledger.contains((params.farm_id, sp.sender)):
-                self.data.ledger[
-                    (params.farm_id, sp.sender)
-                ].amount += params.token_amount
-            else:
-                self.data.ledger[(params.farm_id, sp.sender)] = sp.record(
-                    amount=params.token_amount,
-                    reward_debt=self.data.farms[params.farm_id].acc_reward_per_share
-                    * params.token_amount
-                    / DECIMAL,
-                    lock_end_time=sp.now,
-                )
-            sp.trace(
-                (
-                    "Reward Balance",
-                    self.data.farms[params.farm_id].reward_supply
-                    - self.data.farms[params.farm_id].reward_paid,
                 )
             )
-            sp.trace(("Pool Balance", self.data.farms[params.farm_id].pool_balance))
             sp.trace("~~~~~~~~~~~~~~~ End of Txn ~~~~~~~~~~~~~~~~")
-            sp.emit(
-                sp.record(
-                    farm_id=params.farm_id,
-                    user=sp.sender,
-                    amount=params.token_amount,
-                ),
-                tag="TokensDeposited",
-            )
 
         # Harvest rewards
         @sp.entrypoint
         def harvest(self, farm_id):
             sp.cast(farm_id, sp.nat)
             sp.trace(("Current Time", sp.now))
-            if (
-                self.data.ledger.contains((farm_id, sp.sender))
-                and self.data.ledger[(farm_id, sp.sender)].amount > 0
-            ):
-                harvest_rewards(sp.record(farm_id=farm_id, user=sp.sender))
-            sp.trace(
-                (
-                    "Reward Balance",
-                    self.data.farms[farm_id].reward_supply
-                    - self.data.farms[farm_id].reward_paid,
+            send_transfers(
+                harvest_tokens(
+                    sp.record(farm_id=farm_id, transfers=sp.record(fa2={}, fa12={}))
                 )
             )
-            sp.trace(("Pool Balance", self.data.farms[farm_id].pool_balance))
             sp.trace("~~~~~~~~~~~~~~~ End of Txn ~~~~~~~~~~~~~~~~")
 
+        # Harvest rewards from several farms in one call
+        @sp.entrypoint
+        def harvestMany(self, farm_ids):
+            sp.cast(farm_ids, sp.list[sp.nat])
+            sp.trace(("Current Time", sp.now))
+            # Rewards of the same token are merged into a single transfer
+            transfers = sp.cast(
+                sp.record(fa2={}, fa12={}), farming_types.pending_transfers_type
+            )
+            for farm_id in farm_ids:
+                transfers = harvest_tokens(
+                    sp.record(farm_id=farm_id, transfers=transfers)
+                )
+            send_transfers(transfers)
+            sp.trace("~~~~~~~~~~~~~~~ End of Txn ~~~~~~~~~~~~~~~~")
+
+        # Add the pending rewards to the deposit, for farms where the pool token
+        # is also the reward token
+        @sp.entrypoint
+        def compound(self, farm_id):
+            sp.cast(farm_id, sp.nat)
+            sp.trace(("Current Time", sp.now))
+            farm = self.data.farm_states.get(farm_id, error="FarmNotFound")
+            assert farm.pool_token == farm.reward_token, "NotCompoundable"
+            assert farm.start_time <= sp.now, "FarmNotStarted"
+            position = self.data.ledger.get((farm_id, sp.sender), error="NoDeposits")
+            farm = accrue_rewards(sp.record(farm_id=farm_id, farm=farm))
+            reward = calculate_pending_rewards(sp.record(farm=farm, position=position))
+            farm.reward_paid += reward
+            # Rewards of the other streams are kept unclaimed, before the
+            # amount changes
+            streams = harvest_streams(
+                sp.record(
+                    user=sp.sender,
+                    claim=False,
+                    farm=farm,
+                    position=position,
+                    transfers=sp.record(fa2={}, fa12={}),
+                )
+            )
+            farm = streams.farm
+            position = streams.position
+            # Unclaimed rewards were already taken from the reward supply
+            reward += position.unclaimed
+            position.unclaimed = 0
+            sp.trace(("User Rewards", reward))
+            # The reward stays in the contract and moves from the reward supply
+            # to the pool
+            farm.pool_balance += reward
+            position.amount += reward
+            position = update_reward_debts(sp.record(farm=farm, position=position))
+            self.data.farm_states[farm_id] = farm
+            self.data.ledger[(farm_id, sp.sender)] = position
+            sp.trace(("Reward Balance", farm.reward_supply - farm.reward_paid))
+            sp.trace(("Pool Balance", farm.pool_balance))
+            sp.trace("~~~~~~~~~~~~~~~ End of Txn ~~~~~~~~~~~~~~~~")
+            sp.emit(
+                sp.cast(
+                    sp.record(
+                        version=EVENT_VERSION,
+                        farm_id=farm_id,
+                        user=sp.sender,
+                        amount=reward,
+                        reward=reward,
+                        stream_rewards={},
+                        farm=farm_event_state(farm),
+                        position=position,
+                    ),
+                    farming_types.tokens_event_type,
+                ),
+                tag="Compounded",
+            )
+
         # Withdraw tokens from farm
         @sp.entrypoint
         def withdraw(self, params):
-            sp.cast(params, sp.record(farm_id=sp.nat, token_amount=sp.nat))
+            sp.cast(params, farming_types.farm_amount_params_type)
             sp.trace(("Current Time", sp.now))
-            assert self.data.farms.contains(params.farm_id), "FarmNotFound"
-            farm = self.data.farms[params.farm_id]
-            assert farm.start_time <= sp.now, "FarmNotStarted"
-            assert self.data.ledger.contains((params.farm_id, sp.sender)), "NoDeposits"
-            assert (
-                self.data.ledger[(params.farm_id, sp.sender)].amount
-                >= params.token_amount
-            ), "InsufficientDeposits"
-            if self.data.farms[params.farm_id].lock_duration > 0:
-                assert (
-                    self.data.ledger[(params.farm_id, sp.sender)].lock_end_time
-                    <= sp.now
-                ), "TokensLocked"
-            if (
-                self.data.ledger.contains((params.farm_id, sp.sender))
-                and self.data.ledger[(params.farm_id, sp.sender)].amount > 0
-            ):
-                harvest_rewards(sp.record(farm_id=params.farm_id, user=sp.sender))
-            self.data.ledger[(params.farm_id, sp.sender)].amount = sp.as_nat(
-                self.data.ledger[(params.farm_id, sp.sender)].amount
-                - params.token_amount
-            )
-            with sp.match(farm.pool_token.token_type):
-                with sp.case.fa12 as data:
-                    assert data == ()
-                    trasfer_params = sp.record(
-                        token_address=farm.pool_token.address,
-                        token_amount=params.token_amount,
-                        from_address=sp.self_address(),
-                        to_address=sp.sender,
-                    )
-                    transfer_fa12_token(trasfer_params)
-                with sp.case.fa2 as data:
-                    assert data == ()
-                    trasfer_params = sp.record(
-                        token_address=farm.pool_token.address,
-                        token_id=farm.pool_token.token_id,
+            send_transfers(
+                withdraw_tokens(
+                    sp.record(
+                        farm_id=params.farm_id,
                         token_amount=params.token_amount,
-                        from_address=sp.self_address(),
-                        to_address=sp.sender,
+                        transfers=sp.record(fa2={}, fa12={}),
                     )
-                    transfer_fa2_token(trasfer_params)
-            self.data.farms[params.farm_id].pool_balance = sp.as_nat(
-                self.data.farms[params.farm_id].pool_balance - params.token_amount
+                )
+            )
+            sp.trace("~~~~~~~~~~~~~~~ End of Txn ~~~~~~~~~~~~~~~~")
+
+        # Deposit tokens to several farms in one call, the transfers of the same
+        # token contract are merged
+        @sp.entrypoint
+        def depositMany(self, params):
+            sp.cast(params, sp.list[farming_types.farm_amount_params_type])
+            sp.trace(("Current Time", sp.now))
+            transfers = sp.cast(
+                sp.record(fa2={}, fa12={}), farming_types.pending_transfers_type
             )
-            if self.data.ledger[(params.farm_id, sp.sender)].amount == 0:
-                del self.data.ledger[(params.farm_id, sp.sender)]
-            sp.trace(
-                (
-                    "Reward Balance",
-                    self.data.farms[params.farm_id].reward_supply
-                    - self.data.farms[params.farm_id].reward_paid,
+            for leg in params:
+                transfers = deposit_tokens(
+                    sp.record(
+                        farm_id=leg.farm_id,
+                        token_amount=leg.token_amount,
+                        transfers=transfers,
+                    )
                 )
+            send_transfers(transfers)
+            sp.trace("~~~~~~~~~~~~~~~ End of Txn ~~~~~~~~~~~~~~~~")
+
+        # Withdraw tokens from several farms in one call, the transfers of the
+        # same token contract are merged
+        @sp.entrypoint
+        def withdrawMany(self, params):
+            sp.cast(params, sp.list[farming_types.farm_amount_params_type])
+            sp.trace(("Current Time", sp.now))
+            transfers = sp.cast(
+                sp.record(fa2={}, fa12={}), farming_types.pending_transfers_type
             )
-            sp.trace(("Pool Balance", self.data.farms[params.farm_id].pool_balance))
+            for leg in params:
+                transfers = withdraw_tokens(
+                    sp.record(
+                        farm_id=leg.farm_id,
+                        token_amount=leg.token_amount,
+                        transfers=transfers,
+                    )
+                )
+            send_transfers(transfers)
             sp.trace("~~~~~~~~~~~~~~~ End of Txn ~~~~~~~~~~~~~~~~")
-            sp.emit(
+
+        # Withdraw the whole deposit without accruing nor paying the rewards,
+        # which are given up. Unclaimed rewards go back to the reward supply.
+        @sp.entrypoint
+        def emergencyWithdraw(self, farm_id):
+            sp.cast(farm_id, sp.nat)
+            emergency_withdraw_tokens(farm_id)
+
+        # Move a deposit to another farm of the same pool token, without
+        # transferring the pool tokens
+        @sp.entrypoint
+        def migrateStake(self, params):
+            sp.cast(params, farming_types.migrate_stake_params_type)
+            sp.trace(("Current Time", sp.now))
+            assert params.from_farm != params.to_farm, "SameFarm"
+            assert params.token_amount > 0, "InvalidAmount"
+            from_farm = self.data.farm_states.get(
+                params.from_farm, error="FarmNotFound"
+            )
+            to_farm = self.data.farm_states.get(params.to_farm, error="FarmNotFound")
+            assert from_farm.pool_token == to_farm.pool_token, "PoolTokenMismatch"
+            assert from_farm.start_time <= sp.now, "FarmNotStarted"
+            assert to_farm.start_time <= sp.now, "FarmNotStarted"
+            assert to_farm.end_time >= sp.now, "FarmEnded"
+            assert not to_farm.ended, "FarmEnded"
+            from_position = self.data.ledger.get(
+                (params.from_farm, sp.sender), error="NoDeposits"
+            )
+            assert from_position.amount >= params.token_amount, "InsufficientDeposits"
+            if from_farm.lock_duration > 0:
+                assert from_position.lock_end_time <= sp.now, "TokensLocked"
+            to_position = self.data.ledger.get(
+                (params.to_farm, sp.sender),
+                default=sp.record(
+                    amount=0,
+                    reward_debt=0,
+                    lock_end_time=sp.now,
+                    unclaimed=0,
+                    streams={},
+                ),
+            )
+            transfers = sp.cast(
+                sp.record(fa2={}, fa12={}), farming_types.pending_transfers_type
+            )
+
+            # Harvest and withdraw from the first farm
+            harvest = harvest_rewards(
                 sp.record(
-                    farm_id=params.farm_id,
+                    farm_id=params.from_farm,
                     user=sp.sender,
-                    amount=params.token_amount,
+                    claim=from_position.amount == params.token_amount,
+                    farm=accrue_rewards(
+                        sp.record(farm_id=params.from_farm, farm=from_farm)
+                    ),
+                    position=from_position,
+                    transfers=transfers,
+                )
+            )
+            from_farm = harvest.farm
+            from_position = harvest.position
+            transfers = harvest.transfers
+            from_reward = harvest.reward
+            from_stream_rewards = harvest.stream_rewards
+            from_farm.pool_balance = sp.as_nat(
+                from_farm.pool_balance - params.token_amount
+            )
+            from_position.amount = sp.as_nat(from_position.amount - params.token_amount)
+            from_position = update_reward_debts(
+                sp.record(farm=from_farm, position=from_position)
+            )
+            self.data.farm_states[params.from_farm] = from_farm
+            if from_position.amount == 0:
+                del self.data.ledger[(params.from_farm, sp.sender)]
+            else:
+                self.data.ledger[(params.from_farm, sp.sender)] = from_position
+
+            # Harvest and deposit into the second farm
+            to_farm = accrue_rewards(sp.record(farm_id=params.to_farm, farm=to_farm))
+            to_reward = sp.nat(0)
+            to_stream_rewards = sp.cast({}, sp.map[sp.nat, sp.nat])
+            if to_position.amount > 0:
+                harvest = harvest_rewards(
+                    sp.record(
+                        farm_id=params.to_farm,
+                        user=sp.sender,
+                        claim=False,
+                        farm=to_farm,
+                        position=to_position,
+                        transfers=transfers,
+                    )
+                )
+                to_farm = harvest.farm
+                to_position = harvest.position
+                transfers = harvest.transfers
+                to_reward = harvest.reward
+                to_stream_rewards = harvest.stream_rewards
+            to_farm.pool_balance += params.token_amount
+            to_position.amount += params.token_amount
+            to_position = update_reward_debts(
+                sp.record(farm=to_farm, position=to_position)
+            )
+            self.data.farm_states[params.to_farm] = to_farm
+            self.data.ledger[(params.to_farm, sp.sender)] = to_position
+
+            send_transfers(transfers)
+            sp.trace("~~~~~~~~~~~~~~~ End of Txn ~~~~~~~~~~~~~~~~")
+            # Indexers see a withdrawal followed by a deposit
+            sp.emit(
+                sp.cast(
+                    sp.record(
+                        version=EVENT_VERSION,
+                        farm_id=params.from_farm,
+                        user=sp.sender,
+                        amount=params.token_amount,
+                        reward=from_reward,
+                        stream_rewards=from_stream_rewards,
+                        farm=farm_event_state(from_farm),
+                        position=from_position,
+                    ),
+                    farming_types.tokens_event_type,
                 ),
                 tag="TokensWithdrawn",
             )
+            sp.emit(
+                sp.cast(
+                    sp.record(
+                        version=EVENT_VERSION,
+                        farm_id=params.to_farm,
+                        user=sp.sender,
+                        amount=params.token_amount,
+                        reward=to_reward,
+                        stream_rewards=to_stream_rewards,
+                        farm=farm_event_state(to_farm),
+                        position=to_position,
+                    ),
+                    farming_types.tokens_event_type,
+                ),
+                tag="TokensDeposited",
+            )
 
+        # Add a reward token to a farm, paid to the stakers until the end of the
+        # farm next to the farm reward token. Only the farm owner and the
+        # administrator can add a stream.
         @sp.entrypoint
-        def endFarm(self, farm_id):
-            sp.cast(farm_id, sp.nat)
+        def addRewardStream(self, params):
+            sp.cast(params, farming_types.add_reward_stream_params_type)
+            sp.trace(("Current Time", sp.now))
+            farm = self.data.farm_states.get(params.farm_id, error="FarmNotFound")
+            config = self.data.farm_configs[params.farm_id]
+            assert (
+                sp.sender == config.owner
+                or sp.sender == self.data.administration_panel.administrator
+            ), "NotOwner"
+            assert sp.now < farm.end_time, "FarmEnded"
+            assert not farm.ended, "FarmEnded"
+            assert sp.len(farm.streams) < MAX_REWARD_STREAMS, "TooManyRewardStreams"
+            # Rewards accrued before the stream starts are not shared with it
+            if farm.start_time <= sp.now:
+                farm = accrue_rewards(sp.record(farm_id=params.farm_id, farm=farm))
+            stream_id = sp.len(farm.streams)
+            reward_per_second = params.reward_supply / remaining_weight(
+                sp.record(farm_id=params.farm_id, farm=farm)
+            )
+            assert reward_per_second > 0, "InvalidRewardSupply"
+            farm.streams[stream_id] = sp.record(
+                reward_token=params.reward_token,
+                reward_supply=params.reward_supply,
+                reward_paid=0,
+                reward_per_second=reward_per_second,
+                acc_reward_per_share=0,
+            )
+            config.streams[stream_id] = sp.record(owner=sp.sender)
+            self.data.farm_states[params.farm_id] = farm
+            self.data.farm_configs[params.farm_id] = config
+            transfers = queue_token_transfer(
+                sp.record(
+                    transfers=sp.cast(
+                        sp.record(fa2={}, fa12={}), farming_types.pending_transfers_type
+                    ),
+                    token=params.reward_token,
+                    token_amount=params.reward_supply,
+                    from_address=sp.sender,
+                    to_address=sp.self_address(),
+                )
+            )
+            send_transfers(transfers)
+            sp.emit(
+                sp.cast(
+                    sp.record(
+                        version=EVENT_VERSION,
+                        farm_id=params.farm_id,
+                        stream_id=stream_id,
+                        reward_token=params.reward_token,
+                        reward_supply=params.reward_supply,
+                        reward_per_second=reward_per_second,
+                        owner=sp.sender,
+                        farm=farm_event_state(farm),
+                    ),
+                    farming_types.reward_stream_added_event_type,
+                ),
+                tag="RewardStreamAdded",
+            )
+
+        # Publish the merkle root of a reward drop to the stakers of a farm. The
+        # sender funds the drop in the farm reward token.
+        @sp.entrypoint
+        def publishDistribution(self, params):
+            sp.cast(params, farming_types.publish_distribution_params_type)
             self._isAdmin()
-            assert self.data.farms.contains(farm_id), "FarmNotFound"
-            farm = self.data.farms[farm_id]
-            assert farm.owner == sp.sender, "NotOwner"
-            assert farm.pool_balance == 0, "PoolBalanceNotZero"
-            with sp.match(farm.pool_token.token_type):
-                with sp.case.fa12 as data:
-                    assert data == ()
-                    trasfer_params = sp.record(
-                        token_address=farm.reward_token.address,
-                        token_amount=sp.as_nat(
-                            self.data.farms[farm_id].reward_supply
-                            - self.data.farms[farm_id].reward_paid
+            farm = self.data.farm_states.get(params.farm_id, error="FarmNotFound")
+            assert params.total > 0, "InvalidAmount"
+            assert params.expiry > sp.now, "InvalidExpiry"
+            distribution_id = self.data.next_distribution_id
+            self.data.distributions[distribution_id] = sp.record(
+                farm_id=params.farm_id,
+                merkle_root=params.merkle_root,
+                total=params.total,
+                claimed=0,
+                expiry=params.expiry,
+            )
+            self.data.next_distribution_id += 1
+            send_transfers(
+                queue_token_transfer(
+                    sp.record(
+                        transfers=sp.cast(
+                            sp.record(fa2={}, fa12={}),
+                            farming_types.pending_transfers_type,
+                        ),
+                        token=farm.reward_token,
+                        token_amount=params.total,
+                        from_address=sp.sender,
+                        to_address=sp.self_address(),
+                    )
+                )
+            )
+            sp.emit(
+                sp.cast(
+                    sp.record(
+                        version=EVENT_VERSION,
+                        distribution_id=distribution_id,
+                        farm_id=params.farm_id,
+                        merkle_root=params.merkle_root,
+                        total=params.total,
+                        expiry=params.expiry,
+                    ),
+                    farming_types.distribution_published_event_type,
+                ),
+                tag="DistributionPublished",
+            )
+
+        # Claim the amount of the sender in a distribution, with the merkle proof
+        # of the `(sender, amount)` leaf
+        @sp.entrypoint
+        def claimDistribution(self, params):
+            sp.cast(params, farming_types.claim_distribution_params_type)
+            distribution = self.data.distributions.get(
+                params.distribution_id, error="DistributionNotFound"
+            )
+            assert sp.now < distribution.expiry, "DistributionExpired"
+            claim_key = (params.distribution_id, sp.sender)
+            assert not self.data.distribution_claims.contains(
+                claim_key
+            ), "AlreadyClaimed"
+            node = sp.blake2b(sp.pack((sp.sender, params.amount)))
+            for sibling in params.proof:
+                node = hash_merkle_pair(sp.record(node=node, sibling=sibling))
+            assert node == distribution.merkle_root, "InvalidProof"
+            distribution.claimed += params.amount
+            assert distribution.claimed <= distribution.total, "DistributionExhausted"
+            self.data.distributions[params.distribution_id] = distribution
+            self.data.distribution_claims[claim_key] = ()
+            send_transfers(
+                queue_token_transfer(
+                    sp.record(
+                        transfers=sp.cast(
+                            sp.record(fa2={}, fa12={}),
+                            farming_types.pending_transfers_type,
                         ),
+                        token=self.data.farm_states[distribution.farm_id].reward_token,
+                        token_amount=params.amount,
                         from_address=sp.self_address(),
                         to_address=sp.sender,
                     )
-                    transfer_fa12_token(trasfer_params)
-                with sp.case.fa2 as data:
-                    assert data == ()
-                    trasfer_params = sp.record(
-                        token_address=farm.reward_token.address,
-                        token_id=farm.pool_token.token_id,
-                        token_amount=sp.as_nat(
-                            self.data.farms[farm_id].reward_supply
-                            - self.data.farms[farm_id].reward_paid
+                )
+            )
+            sp.emit(
+                sp.cast(
+                    sp.record(
+                        version=EVENT_VERSION,
+                        distribution_id=params.distribution_id,
+                        farm_id=distribution.farm_id,
+                        user=sp.sender,
+                        amount=params.amount,
+                    ),
+                    farming_types.distribution_claimed_event_type,
+                ),
+                tag="DistributionClaimed",
+            )
+
+        # Send the unclaimed rest of an expired distribution back to the
+        # administrator
+        @sp.entrypoint
+        def reclaimDistribution(self, distribution_id):
+            sp.cast(distribution_id, sp.nat)
+            self._isAdmin()
+            distribution = self.data.distributions.get(
+                distribution_id, error="DistributionNotFound"
+            )
+            assert sp.now >= distribution.expiry, "DistributionNotExpired"
+            amount = sp.as_nat(distribution.total - distribution.claimed)
+            assert amount > 0, "DistributionExhausted"
+            distribution.claimed = distribution.total
+            self.data.distributions[distribution_id] = distribution
+            send_transfers(
+                queue_token_transfer(
+                    sp.record(
+                        transfers=sp.cast(
+                            sp.record(fa2={}, fa12={}),
+                            farming_types.pending_transfers_type,
                         ),
+                        token=self.data.farm_states[distribution.farm_id].reward_token,
+                        token_amount=amount,
                         from_address=sp.self_address(),
                         to_address=sp.sender,
                     )
-                    transfer_fa2_token(trasfer_params)
-            sp.emit(sp.record(farm_id=farm_id), tag="FarmEnded")
+                )
+            )
+            sp.emit(
+                sp.cast(
+                    sp.record(
+                        version=EVENT_VERSION,
+                        distribution_id=distribution_id,
+                        farm_id=distribution.farm_id,
+                        amount=amount,
+                    ),
+                    farming_types.distribution_reclaimed_event_type,
+                ),
+                tag="DistributionReclaimed",
+            )
+
+        @sp.entrypoint
+        def endFarm(self, farm_id):
+            sp.cast(farm_id, sp.nat)
+            self._isAdmin()
+            farm = end_farm(farm_id)
+            pool_token_key = (farm.pool_token.address, farm.pool_token.token_id)
+            pool_token_farms = self.data.pool_token_farms.get(
+                pool_token_key, default=set()
+            )
+            pool_token_farms.remove(farm_id)
+            if sp.len(pool_token_farms) == 0:
+                del self.data.pool_token_farms[pool_token_key]
+            else:
+                self.data.pool_token_farms[pool_token_key] = pool_token_farms
+
+        # Get the farm data
+        @sp.onchain_view()
+        def getFarm(self, farm_id):
+            sp.cast(farm_id, sp.nat)
+            return load_farm(farm_id).unwrap_some(error="FarmNotFound")
+
+        # Get the ledger data
+        @sp.onchain_view()
+        def getLedger(self, params):
+            sp.cast(params, sp.record(farm_id=sp.nat, user=sp.address))
+            return self.data.ledger.get(
+                (params.farm_id, params.user), error="DepositsNotFound"
+            )
+
+        # Get the data of several farms, None for unknown farm ids
+        @sp.onchain_view()
+        def getFarmsById(self, farm_ids):
+            sp.cast(farm_ids, sp.list[sp.nat])
+            farms = []
+            for farm_id in farm_ids:
+                farms.push(load_farm(farm_id))
+            return reversed(farms)
+
+        # Get up to `count` farms starting from `from_id`
+        @sp.onchain_view()
+        def getFarms(self, params):
+            sp.cast(params, sp.record(from_id=sp.nat, count=sp.nat))
+            farms = []
+            farm_id = params.from_id
+            while (
+                farm_id < self.data.next_farm_id
+                and farm_id < params.from_id + params.count
+            ):
+                farms.push(
+                    sp.record(farm_id=farm_id, farm=load_farm(farm_id).unwrap_some())
+                )
+                farm_id += 1
+            return reversed(farms)
+
+        # Get up to `count` active farm ids of a pool token, from `from_id`
+        @sp.onchain_view()
+        def getFarmsByPoolToken(self, params):
+            sp.cast(
+                params,
+                sp.record(
+                    pool_token=farming_types.pool_token_key_type,
+                    from_id=sp.nat,
+                    count=sp.nat,
+                ),
+            )
+            farm_ids = []
+            for farm_id in self.data.pool_token_farms.get(
+                params.pool_token, default=set()
+            ).elements():
+                if farm_id >= params.from_id and sp.len(farm_ids) < params.count:
+                    farm_ids.push(farm_id)
+            return reversed(farm_ids)
+
+        # Get several ledger entries, None for unknown entries
+        @sp.onchain_view()
+        def getLedgers(self, keys):
+            sp.cast(keys, sp.list[farming_types.ledger_key_type])
+            ledgers = []
+            for key in keys:
+                ledgers.push(self.data.ledger.get_opt(key))
+            return reversed(ledgers)
+
+        # Get the rewards a user would harvest now
+        @sp.onchain_view()
+        def getPendingRewards(self, params):
+            sp.cast(params, sp.record(farm_id=sp.nat, user=sp.address))
+            return project_pending_rewards(params)
+
+        # Get the rewards of each reward stream a user would harvest now
+        @sp.onchain_view()
+        def getPendingStreamRewards(self, params):
+            sp.cast(params, sp.record(farm_id=sp.nat, user=sp.address))
+            return project_pending_stream_rewards(params)
+
+        @sp.offchain_view
+        def pendingRewards(self, params):
+            """(Offchain view) Return the rewards `user` would harvest now from `farm_id`."""
+            sp.cast(params, sp.record(farm_id=sp.nat, user=sp.address))
+            return project_pending_rewards(params)
+
+    class FarmContract(sp.Contract):
+        # Farm contract originated by the farm factory, holding the single farm
+        # `0`. It only has the staking entrypoints and views, which keeps the
+        # contract embedded in the factory small, and no `createFarm`. Its
+        # storage only has the farm and ledger big_maps the staking helpers use,
+        # so each origination only pays for these.
+        def __init__(self, metadata):
+            # Metadata of the contract
+            self.data.metadata = sp.cast(metadata, sp.big_map[sp.string, sp.bytes])
+            # Farm states big_map to store the accrual data, updated on every call
+            self.data.farm_states = sp.cast(
+                sp.big_map(), sp.big_map[sp.nat, farming_types.farm_state_type]
+            )
+            # Farm configs big_map to store the data set at farm creation
+            self.data.farm_configs = sp.cast(
+                sp.big_map(), sp.big_map[sp.nat, farming_types.farm_config_type]
+            )
+            # Farm epochs big_map to store the bonus schedule of the farm
+            self.data.farm_epochs = sp.cast(
+                sp.big_map(),
+                sp.big_map[sp.pair[sp.nat, sp.nat], farming_types.farm_epoch_type],
+            )
+            # Farm bonuses big_map to store the bonus periods of the farm
+            self.data.farm_bonuses = sp.cast(
+                sp.big_map(),
+                sp.big_map[
+                    sp.nat,
+                    sp.set[sp.record(end_time=sp.timestamp, multipier=sp.nat)],
+                ],
+            )
+            # Ledger to store the user data
+            self.data.ledger = sp.cast(
+                sp.big_map(),
+                sp.big_map[
+                    farming_types.ledger_key_type, farming_types.ledger_value_type
+                ],
+            )
+
+        # Deposit tokens to the farm
+        @sp.entrypoint
+        def deposit(self, params):
+            sp.cast(params, farming_types.farm_amount_params_type)
+            send_transfers(
+                deposit_tokens(
+                    sp.record(
+                        farm_id=params.farm_id,
+                        token_amount=params.token_amount,
+                        transfers=sp.record(fa2={}, fa12={}),
+                    )
+                )
+            )
+
+        # Harvest rewards
+        @sp.entrypoint
+        def harvest(self, farm_id):
+            sp.cast(farm_id, sp.nat)
+            send_transfers(
+                harvest_tokens(
+                    sp.record(farm_id=farm_id, transfers=sp.record(fa2={}, fa12={}))
+                )
+            )
+
+        # Withdraw tokens from the farm
+        @sp.entrypoint
+        def withdraw(self, params):
+            sp.cast(params, farming_types.farm_amount_params_type)
+            send_transfers(
+                withdraw_tokens(
+                    sp.record(
+                        farm_id=params.farm_id,
+                        token_amount=params.token_amount,
+                        transfers=sp.record(fa2={}, fa12={}),
+                    )
+                )
+            )
+
+        # Withdraw the whole deposit, giving up the rewards
+        @sp.entrypoint
+        def emergencyWithdraw(self, farm_id):
+            sp.cast(farm_id, sp.nat)
+            emergency_withdraw_tokens(farm_id)
+
+        # End the farm, the farm owner gets back the rewards left
+        @sp.entrypoint
+        def endFarm(self, farm_id):
+            sp.cast(farm_id, sp.nat)
+            end_farm(farm_id)
 
         # Get the farm data
         @sp.onchain_view()
         def getFarm(self, farm_id):
             sp.cast(farm_id, sp.nat)
-            assert self.data.farms.contains(farm_id), "FarmNotFound"
-            return self.data.farms[farm_id]
+            return load_farm(farm_id).unwrap_some(error="FarmNotFound")
 
         # Get the ledger data
         @sp.onchain_view()
         def getLedger(self, params):
             sp.cast(params, sp.record(farm_id=sp.nat, user=sp.address))
-            assert self.data.ledger.contains(
-                (params.farm_id, params.user)
-            ), "DepositsNotFound"
-            return self.data.ledger[(params.farm_id, params.user)]
+            return self.data.ledger.get(
+                (params.farm_id, params.user), error="DepositsNotFound"
+            )
+
+        # Get the rewards a user would harvest now
+        @sp.onchain_view()
+        def getPendingRewards(self, params):
+            sp.cast(params, sp.record(farm_id=sp.nat, user=sp.address))
+            return project_pending_rewards(params)
+
+    class FarmFactory(sp.Contract):
+        # Originate one farm contract per farm. Each farm contract holds a
+        # single farm with its own ledger, the factory only keeps a registry.
+        def __init__(self, metadata, farm_metadata):
+            # Metadata of the contract
+            self.data.metadata = sp.cast(metadata, sp.big_map[sp.string, sp.bytes])
+            # Metadata url of the originated farm contracts
+            self.data.farm_metadata = sp.cast(farm_metadata, sp.bytes)
+            # Registry of the originated farm contracts
+            self.data.farms = sp.cast(
+                sp.big_map(), sp.big_map[sp.nat, farming_types.farm_registry_type]
+            )
+            # Total farms count
+            self.data.next_farm_id = sp.cast(0, sp.nat)
+
+        # Originate a farm contract holding a new farm, the sender is the owner
+        # of the farm
+        @sp.entrypoint
+        def createFarm(self, params):
+            sp.cast(params, farming_types.create_farm_params_type)
+            sp.trace(("Current Time", sp.now))
+            farm_id = self.data.next_farm_id
+            new_farm = build_farm(sp.record(params=params, owner=sp.sender))
+            farm_epochs = sp.cast(
+                sp.big_map(),
+                sp.big_map[sp.pair[sp.nat, sp.nat], farming_types.farm_epoch_type],
+            )
+            for epoch in new_farm.epochs.values():
+                farm_epochs[(0, epoch.index)] = epoch
+            farm_bonuses = sp.cast(
+                sp.big_map(),
+                sp.big_map[
+                    sp.nat,
+                    sp.set[sp.record(end_time=sp.timestamp, multipier=sp.nat)],
+                ],
+            )
+            if sp.len(params.bonuses) > 0:
+                farm_bonuses[0] = params.bonuses
+            farm_address = sp.create_contract(
+                FarmContract,
+                None,
+                sp.mutez(0),
+                sp.record(
+                    metadata=sp.big_map({"": self.data.farm_metadata}),
+                    farm_states=sp.big_map({0: new_farm.state}),
+                    farm_configs=sp.big_map({0: new_farm.config}),
+                    farm_epochs=farm_epochs,
+                    farm_bonuses=farm_bonuses,
+                    ledger=sp.big_map(),
+                ),
+            )
+            self.data.farms[farm_id] = sp.record(
+                address=farm_address,
+                pool_token=params.pool_token,
+                reward_token=params.reward_token,
+                owner=sp.sender,
+            )
+            self.data.next_farm_id += 1
+            # The reward supply goes straight to the farm contract
+            send_transfers(
+                queue_token_transfer(
+                    sp.record(
+                        transfers=sp.cast(
+                            sp.record(fa2={}, fa12={}),
+                            farming_types.pending_transfers_type,
+                        ),
+                        token=params.reward_token,
+                        token_amount=params.reward_supply,
+                        from_address=sp.sender,
+                        to_address=farm_address,
+                    )
+                )
+            )
+            sp.trace("~~~~~~~~~~~~~~~ End of Txn ~~~~~~~~~~~~~~~~")
+            sp.emit(
+                sp.cast(
+                    sp.record(
+                        version=EVENT_VERSION,
+                        farm_id=farm_id,
+                        address=farm_address,
+                        pool_token=params.pool_token,
+                        reward_token=params.reward_token,
+                        owner=sp.sender,
+                    ),
+                    farming_types.farm_originated_event_type,
+                ),
+                tag="FarmOriginated",
+            )
+
+        # Get the registry entry of a farm
+        @sp.onchain_view()
+        def getFarmContract(self, farm_id):
+            sp.cast(farm_id, sp.nat)
+            return self.data.farms.get(farm_id, error="FarmNotFound")
+
+        # Get the registry entries of several farms, None for unknown farm ids
+        @sp.onchain_view()
+        def getFarmContracts(self, farm_ids):
+            sp.cast(farm_ids, sp.list[sp.nat])
+            farms = []
+            for farm_id in farm_ids:
+                farms.push(self.data.farms.get_opt(farm_id))
+            return reversed(farms)
 
 
 if __name__ == "__main__":
@@ -46,23 +46,14 @@ if __name__ == "__main__":
             _sender=Address.admin,
         )
 
-        token.mint(
-            sp.record(
-                amount=sp.nat(1_000_000_000_000_000),
-                to_=Address.alice,
-                token=sp.variant("existing", sp.nat(0)),
-            ),
-            _sender=Address.admin,
-        )
-
-        token.mint(
-            sp.record(
-                amount=sp.nat(1_000_000_000_000_000),
-                to_=Address.bob,
-                token=sp.variant("existing", sp.nat(0)),
-            ),
+        token.mint_batch(
+            [
+                sp.record(to_=Address.alice, token_id=0, amount=1_000_000_000_000_000),
+                sp.record(to_=Address.bob, token_id=0, amount=1_000_000_000_000_000),
+            ],
             _sender=Address.admin,
         )
+        sc.verify(token.data.supply[0] == 3_000_000_000_000_000)
 
         # Current Token Storage
         sc.h2("Current Token Storage")
@@ -156,6 +147,8 @@ if __name__ == "__main__":
             start_time=sp.timestamp(1),
             end_time=sp.timestamp(101),
             lock_duration=sp.nat(0),
+            payout_threshold=None,
+            precision=None,
             bonuses=set(),
         )
         farming_contract.createFarm(
@@ -281,3 +274,839 @@ if __name__ == "__main__":
         sc.show(token.data.ledger)
         sc.show(reward_token.data.ledger)
         sc.show(farming_contract.getFarm(sp.nat(0)))
+
+        # Create Farms 1 and 2 sharing the same reward token
+        sc.h2("Create Farms 1 and 2")
+        for farm_id in range(1, 3):
+            farming_contract.createFarm(
+                sp.record(
+                    pool_token=createFarmParams.pool_token,
+                    reward_token=createFarmParams.reward_token,
+                    reward_supply=sp.nat(100_000_000),
+                    start_time=sp.timestamp(110),
+                    end_time=sp.timestamp(210),
+                    lock_duration=sp.nat(0),
+                    payout_threshold=None,
+                    precision=None,
+                    bonuses=set(),
+                ),
+                _sender=Address.admin,
+                _now=sp.timestamp(105),
+            )
+            farming_contract.deposit(
+                sp.record(farm_id=sp.nat(farm_id), token_amount=sp.nat(1_000_000)),
+                _sender=Address.alice,
+                _now=sp.timestamp(110),
+            )
+
+        # Harvest both farms at once
+        sc.h2("Harvest Many from Farms")
+        alice_rewards = sc.compute(reward_token.data.ledger[(Address.alice, 0)])
+        farming_contract.harvestMany(
+            [sp.nat(1), sp.nat(2)],
+            _sender=Address.alice,
+            _now=sp.timestamp(150),
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 80_000_000
+        )
+
+        # Pending rewards are projected to the current time
+        sc.h2("Pending Rewards")
+        pending_rewards = sc.compute(
+            farming_contract.getPendingRewards(
+                sp.record(farm_id=sp.nat(1), user=Address.alice)
+            ),
+            now=sp.timestamp(170),
+        )
+        sc.verify(pending_rewards == 20_000_000)
+        pending_rewards = sc.compute(
+            farming_contract.getPendingRewards(
+                sp.record(farm_id=sp.nat(1), user=Address.alice)
+            ),
+            now=sp.timestamp(300),
+        )
+        sc.verify(pending_rewards == 60_000_000)
+        pending_rewards = sc.compute(
+            farming_contract.getPendingRewards(
+                sp.record(farm_id=sp.nat(1), user=Address.bob)
+            ),
+            now=sp.timestamp(170),
+        )
+        sc.verify(pending_rewards == 0)
+
+        # Bulk reads
+        sc.h2("Batch Views")
+        farms = sc.compute(farming_contract.getFarmsById([2, 7, 1]))
+        sc.verify(sp.len(farms) == 3)
+        sc.show(farms)
+        farms = sc.compute(farming_contract.getFarms(sp.record(from_id=1, count=5)))
+        sc.verify(sp.len(farms) == 2)
+        sc.show(farms)
+        ledgers = sc.compute(
+            farming_contract.getLedgers(
+                [(sp.nat(1), Address.alice), (sp.nat(1), Address.bob)]
+            )
+        )
+        sc.verify(sp.len(ledgers) == 2)
+        sc.show(ledgers)
+
+        # Log the current storage
+        sc.h2("Current Data")
+        sc.show(farming_contract.data)
+        sc.show(reward_token.data.ledger)
+
+        # Create Farm 3 where the pool token is also the reward token
+        sc.h2("Create Farm 3")
+        farming_contract.createFarm(
+            sp.record(
+                pool_token=createFarmParams.pool_token,
+                reward_token=createFarmParams.pool_token,
+                reward_supply=sp.nat(100_000_000),
+                start_time=sp.timestamp(110),
+                end_time=sp.timestamp(210),
+                lock_duration=sp.nat(0),
+                payout_threshold=None,
+                precision=None,
+                bonuses=set(),
+            ),
+            _sender=Address.admin,
+            _now=sp.timestamp(105),
+        )
+
+        # The harvest and the deposit are sent in a single FA2 batch
+        sc.h2("Deposit twice to Farm 3")
+        alice_tokens = sc.compute(token.data.ledger[(Address.alice, 0)])
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(3), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(110),
+        )
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(3), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(120),
+        )
+        sc.verify(
+            token.data.ledger[(Address.alice, 0)] + 2_000_000
+            == alice_tokens + 10_000_000
+        )
+        sc.verify(farming_contract.data.farm_states[3].pool_balance == 2_000_000)
+
+        # Create Farm 4 with a 3x bonus until 320 and a 2x bonus until 350
+        sc.h2("Create Farm 4 with Bonuses")
+        farming_contract.createFarm(
+            sp.record(
+                pool_token=createFarmParams.pool_token,
+                reward_token=createFarmParams.reward_token,
+                reward_supply=sp.nat(170_000_000),
+                start_time=sp.timestamp(300),
+                end_time=sp.timestamp(400),
+                lock_duration=sp.nat(0),
+                payout_threshold=None,
+                precision=None,
+                bonuses={
+                    sp.record(end_time=sp.timestamp(320), multipier=sp.nat(3)),
+                    sp.record(end_time=sp.timestamp(350), multipier=sp.nat(2)),
+                },
+            ),
+            _sender=Address.admin,
+            _now=sp.timestamp(250),
+        )
+        sc.verify(farming_contract.data.farm_states[4].reward_per_second == 1_000_000)
+        sc.verify(farming_contract.data.farm_epochs[(4, 2)].cumulative_weight == 170)
+        sc.verify(farming_contract.data.farm_states[4].last_epoch_index == 2)
+
+        # Rewards follow the multiplier of each epoch crossed
+        sc.h2("Deposit and Harvest from Farm 4")
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(4), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(300),
+        )
+        pending_rewards = sc.compute(
+            farming_contract.getPendingRewards(
+                sp.record(farm_id=sp.nat(4), user=Address.alice)
+            ),
+            now=sp.timestamp(310),
+        )
+        sc.verify(pending_rewards == 30_000_000)
+        pending_rewards = sc.compute(
+            farming_contract.getPendingRewards(
+                sp.record(farm_id=sp.nat(4), user=Address.alice)
+            ),
+            now=sp.timestamp(330),
+        )
+        sc.verify(pending_rewards == 80_000_000)
+        alice_rewards = sc.compute(reward_token.data.ledger[(Address.alice, 0)])
+        farming_contract.harvest(
+            sp.nat(4), _sender=Address.alice, _now=sp.timestamp(360)
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 130_000_000
+        )
+        farming_contract.withdraw(
+            sp.record(farm_id=sp.nat(4), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(410),
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 170_000_000
+        )
+
+        # Compound the rewards of Farm 3 without any transfer
+        sc.h2("Compound Farm 3")
+        farming_contract.compound(
+            sp.nat(3), _sender=Address.alice, _now=sp.timestamp(130)
+        )
+        sc.verify(farming_contract.data.ledger[(3, Address.alice)].amount == 12_000_000)
+        sc.verify(farming_contract.data.farm_states[3].pool_balance == 12_000_000)
+        sc.verify(farming_contract.data.farm_states[3].reward_paid == 20_000_000)
+        sc.verify(
+            token.data.ledger[(Address.alice, 0)] + 2_000_000
+            == alice_tokens + 10_000_000
+        )
+        farming_contract.compound(
+            sp.nat(1),
+            _sender=Address.alice,
+            _now=sp.timestamp(130),
+            _valid=False,
+            _exception="NotCompoundable",
+        )
+
+        # Create Farm 5 where rewards are paid out from 50 tokens
+        sc.h2("Create Farm 5 with a Payout Threshold")
+        farming_contract.createFarm(
+            sp.record(
+                pool_token=createFarmParams.pool_token,
+                reward_token=createFarmParams.reward_token,
+                reward_supply=sp.nat(100_000_000),
+                start_time=sp.timestamp(500),
+                end_time=sp.timestamp(600),
+                lock_duration=sp.nat(0),
+                payout_threshold=sp.Some(sp.nat(50_000_000)),
+                precision=None,
+                bonuses=set(),
+            ),
+            _sender=Address.admin,
+            _now=sp.timestamp(450),
+        )
+
+        # Deposits keep the rewards in the ledger until the threshold
+        sc.h2("Deferred Rewards on Farm 5")
+        alice_rewards = sc.compute(reward_token.data.ledger[(Address.alice, 0)])
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(5), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(500),
+        )
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(5), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(510),
+        )
+        sc.verify(
+            farming_contract.data.ledger[(5, Address.alice)].unclaimed == 10_000_000
+        )
+        sc.verify(reward_token.data.ledger[(Address.alice, 0)] == alice_rewards)
+        pending_rewards = sc.compute(
+            farming_contract.getPendingRewards(
+                sp.record(farm_id=sp.nat(5), user=Address.alice)
+            ),
+            now=sp.timestamp(520),
+        )
+        sc.verify(pending_rewards == 20_000_000)
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(5), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(560),
+        )
+        sc.verify(farming_contract.data.ledger[(5, Address.alice)].unclaimed == 0)
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 60_000_000
+        )
+
+        # Harvest always pays out, 10 tokens shared by a pool of 3 are rounded down
+        farming_contract.harvest(
+            sp.nat(5), _sender=Address.alice, _now=sp.timestamp(570)
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 69_999_999
+        )
+
+        # Create Farm 6 and add the pool token as a second reward before start
+        sc.h2("Create Farm 6 with Reward Streams")
+        farming_contract.createFarm(
+            sp.record(
+                pool_token=createFarmParams.pool_token,
+                reward_token=createFarmParams.reward_token,
+                reward_supply=sp.nat(100_000_000),
+                start_time=sp.timestamp(700),
+                end_time=sp.timestamp(800),
+                lock_duration=sp.nat(0),
+                payout_threshold=None,
+                precision=None,
+                bonuses=set(),
+            ),
+            _sender=Address.admin,
+            _now=sp.timestamp(650),
+        )
+        farming_contract.addRewardStream(
+            sp.record(
+                farm_id=sp.nat(6),
+                reward_token=createFarmParams.pool_token,
+                reward_supply=sp.nat(50_000_000),
+            ),
+            _sender=Address.admin,
+            _now=sp.timestamp(650),
+        )
+        sc.verify(
+            farming_contract.data.farm_states[6].streams[0].reward_per_second == 500_000
+        )
+
+        # Only the farm owner and the administrator can add a stream
+        farming_contract.addRewardStream(
+            sp.record(
+                farm_id=sp.nat(6),
+                reward_token=createFarmParams.pool_token,
+                reward_supply=sp.nat(50_000_000),
+            ),
+            _sender=Address.bob,
+            _now=sp.timestamp(650),
+            _valid=False,
+            _exception="NotOwner",
+        )
+
+        # One deposit earns both rewards
+        sc.h2("Harvest Reward Streams from Farm 6")
+        alice_rewards = sc.compute(reward_token.data.ledger[(Address.alice, 0)])
+        alice_tokens = sc.compute(token.data.ledger[(Address.alice, 0)])
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(6), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(700),
+        )
+        stream_rewards = sc.compute(
+            farming_contract.getPendingStreamRewards(
+                sp.record(farm_id=sp.nat(6), user=Address.alice)
+            ),
+            now=sp.timestamp(750),
+        )
+        sc.verify(stream_rewards[0] == 25_000_000)
+        farming_contract.harvest(
+            sp.nat(6), _sender=Address.alice, _now=sp.timestamp(750)
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 50_000_000
+        )
+        sc.verify(
+            token.data.ledger[(Address.alice, 0)] + 1_000_000
+            == alice_tokens + 25_000_000
+        )
+
+        # A stream added during the farm is paid over the remaining time
+        farming_contract.addRewardStream(
+            sp.record(
+                farm_id=sp.nat(6),
+                reward_token=createFarmParams.pool_token,
+                reward_supply=sp.nat(10_000_000),
+            ),
+            _sender=Address.admin,
+            _now=sp.timestamp(750),
+        )
+        farming_contract.withdraw(
+            sp.record(farm_id=sp.nat(6), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(800),
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 100_000_000
+        )
+        sc.verify(token.data.ledger[(Address.alice, 0)] == alice_tokens + 60_000_000)
+
+        # Create Farms 7 and 8 on the same pool token
+        sc.h2("Create Farms 7 and 8")
+        for _ in range(2):
+            farming_contract.createFarm(
+                sp.record(
+                    pool_token=createFarmParams.pool_token,
+                    reward_token=createFarmParams.reward_token,
+                    reward_supply=sp.nat(100_000_000),
+                    start_time=sp.timestamp(900),
+                    end_time=sp.timestamp(1000),
+                    lock_duration=sp.nat(0),
+                    payout_threshold=None,
+                    precision=None,
+                    bonuses=set(),
+                ),
+                _sender=Address.admin,
+                _now=sp.timestamp(850),
+            )
+
+        # Part of the deposit moves to Farm 8 without pool token transfers
+        sc.h2("Migrate Stake from Farm 7 to Farm 8")
+        alice_rewards = sc.compute(reward_token.data.ledger[(Address.alice, 0)])
+        alice_tokens = sc.compute(token.data.ledger[(Address.alice, 0)])
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(7), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(900),
+        )
+        farming_contract.migrateStake(
+            sp.record(from_farm=7, to_farm=8, token_amount=400_000),
+            _sender=Address.alice,
+            _now=sp.timestamp(950),
+        )
+        sc.verify(farming_contract.data.ledger[(7, Address.alice)].amount == 600_000)
+        sc.verify(farming_contract.data.ledger[(8, Address.alice)].amount == 400_000)
+        sc.verify(farming_contract.data.farm_states[7].pool_balance == 600_000)
+        sc.verify(farming_contract.data.farm_states[8].pool_balance == 400_000)
+        sc.verify(token.data.ledger[(Address.alice, 0)] + 1_000_000 == alice_tokens)
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 50_000_000
+        )
+        farming_contract.migrateStake(
+            sp.record(from_farm=7, to_farm=0, token_amount=100_000),
+            _sender=Address.alice,
+            _now=sp.timestamp(960),
+            _valid=False,
+            _exception="FarmEnded",
+        )
+
+        # Get the deposit of Farm 8 back without the rewards
+        sc.h2("Emergency Withdraw from Farm 8")
+        farming_contract.emergencyWithdraw(
+            sp.nat(8), _sender=Address.alice, _now=sp.timestamp(970)
+        )
+        sc.verify(~farming_contract.data.ledger.contains((8, Address.alice)))
+        sc.verify(farming_contract.data.farm_states[8].pool_balance == 0)
+        sc.verify(farming_contract.data.farm_states[8].reward_paid == 0)
+        sc.verify(token.data.ledger[(Address.alice, 0)] + 600_000 == alice_tokens)
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 50_000_000
+        )
+
+        # Create Farms 9 and 10 on the same pool token
+        sc.h2("Create Farms 9 and 10")
+        for _ in range(2):
+            farming_contract.createFarm(
+                sp.record(
+                    pool_token=createFarmParams.pool_token,
+                    reward_token=createFarmParams.reward_token,
+                    reward_supply=sp.nat(100_000_000),
+                    start_time=sp.timestamp(1100),
+                    end_time=sp.timestamp(1200),
+                    lock_duration=sp.nat(0),
+                    payout_threshold=None,
+                    precision=None,
+                    bonuses=set(),
+                ),
+                _sender=Address.admin,
+                _now=sp.timestamp(1050),
+            )
+
+        # The pool tokens of all the legs of a rebalance move in one transfer,
+        # through the operator permission of the farming contract
+        sc.h2("Deposit and Withdraw Many")
+        alice_tokens = sc.compute(token.data.ledger[(Address.alice, 0)])
+        contract_tokens = sc.compute(
+            token.data.ledger.get((farming_contract.address, 0), default=0)
+        )
+        farming_contract.depositMany(
+            [
+                sp.record(farm_id=9, token_amount=1_000_000),
+                sp.record(farm_id=10, token_amount=3_000_000),
+            ],
+            _sender=Address.alice,
+            _now=sp.timestamp(1100),
+        )
+        sc.verify(token.data.ledger[(Address.alice, 0)] + 4_000_000 == alice_tokens)
+        sc.verify(
+            token.data.ledger[(farming_contract.address, 0)]
+            == contract_tokens + 4_000_000
+        )
+        sc.verify(
+            token.data.operators.contains(
+                sp.record(
+                    owner=Address.alice,
+                    operator=farming_contract.address,
+                    token_id=0,
+                )
+            )
+        )
+        sc.verify(farming_contract.data.farm_states[9].pool_balance == 1_000_000)
+        sc.verify(farming_contract.data.farm_states[10].pool_balance == 3_000_000)
+        sc.verify(farming_contract.data.ledger[(10, Address.alice)].amount == 3_000_000)
+        farming_contract.withdrawMany(
+            [
+                sp.record(farm_id=9, token_amount=1_000_000),
+                sp.record(farm_id=10, token_amount=1_000_000),
+            ],
+            _sender=Address.alice,
+            _now=sp.timestamp(1150),
+        )
+        sc.verify(token.data.ledger[(Address.alice, 0)] + 2_000_000 == alice_tokens)
+        sc.verify(
+            token.data.ledger[(farming_contract.address, 0)]
+            == contract_tokens + 2_000_000
+        )
+        sc.verify(farming_contract.data.farm_states[9].pool_balance == 0)
+        sc.verify(farming_contract.data.farm_states[10].pool_balance == 2_000_000)
+        sc.verify(farming_contract.data.ledger[(10, Address.alice)].amount == 2_000_000)
+        sc.verify(~farming_contract.data.ledger.contains((9, Address.alice)))
+
+        # Legs only move the tokens the sender let the contract transfer
+        farming_contract.depositMany(
+            [sp.record(farm_id=9, token_amount=1_000_000)],
+            _sender=Address.elon,
+            _now=sp.timestamp(1150),
+            _valid=False,
+            _exception="FA2_NOT_OPERATOR",
+        )
+
+        # Find the active farms of a pool token
+        sc.h2("Farms by Pool Token")
+        farm_ids = sc.compute(
+            farming_contract.getFarmsByPoolToken(
+                sp.record(pool_token=(token.address, 0), from_id=5, count=3)
+            )
+        )
+        sc.verify(sp.pack(farm_ids) == sp.pack([sp.nat(5), 6, 7]))
+        farming_contract.endFarm(
+            sp.nat(8), _sender=Address.admin, _now=sp.timestamp(1300)
+        )
+        farm_ids = sc.compute(
+            farming_contract.getFarmsByPoolToken(
+                sp.record(pool_token=(token.address, 0), from_id=7, count=10)
+            )
+        )
+        sc.verify(sp.pack(farm_ids) == sp.pack([sp.nat(7), 9, 10]))
+
+        # Originate the farm factory
+        sc.h1("Farm Factory")
+        sc.h2("Originate Farm Factory")
+        farm_factory = farming_contract_module.FarmFactory(
+            metadata=sp.scenario_utils.metadata_of_url("https://factory.com"),
+            farm_metadata=sp.bytes("0x68747470733a2f2f6661726d2e636f6d"),
+        )
+        sc += farm_factory
+        reward_token.update_operators(
+            [
+                sp.variant(
+                    "add_operator",
+                    sp.record(
+                        owner=Address.admin,
+                        operator=farm_factory.address,
+                        token_id=0,
+                    ),
+                )
+            ],
+            _sender=Address.admin,
+        )
+
+        # Each farm gets its own contract holding its reward supply
+        sc.h2("Create Farm Contracts")
+        for _ in range(2):
+            farm_factory.createFarm(
+                createFarmParams, _sender=Address.admin, _now=sp.timestamp(1300)
+            )
+        sc.verify(farm_factory.data.next_farm_id == 2)
+        sc.verify(farm_factory.data.farms[0].owner == Address.admin)
+        sc.verify(
+            farm_factory.data.farms[0].address != farm_factory.data.farms[1].address
+        )
+        sc.verify(
+            reward_token.data.ledger[(farm_factory.data.farms[1].address, 0)]
+            == 100_000_000
+        )
+        farm_contracts = sc.compute(farm_factory.getFarmContracts([1, 2]))
+        sc.verify(sp.len(farm_contracts) == 2)
+        sc.show(farm_contracts)
+
+        # Drop extra rewards to the stakers of Farm 10
+        sc.h2("Merkle Distribution on Farm 10")
+        alice_leaf = sc.compute(sp.blake2b(sp.pack((Address.alice, sp.nat(3_000_000)))))
+        bob_leaf = sc.compute(sp.blake2b(sp.pack((Address.bob, sp.nat(1_000_000)))))
+        merkle_root = sc.compute(
+            farming_contract_module.hash_merkle_pair(
+                sp.record(node=alice_leaf, sibling=bob_leaf)
+            )
+        )
+        farming_contract.publishDistribution(
+            sp.record(
+                farm_id=10,
+                merkle_root=merkle_root,
+                total=4_000_000,
+                expiry=sp.timestamp(1400),
+            ),
+            _sender=Address.admin,
+            _now=sp.timestamp(1300),
+        )
+        alice_rewards = sc.compute(reward_token.data.ledger[(Address.alice, 0)])
+        farming_contract.claimDistribution(
+            sp.record(distribution_id=0, amount=3_000_000, proof=[bob_leaf]),
+            _sender=Address.alice,
+            _now=sp.timestamp(1310),
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 3_000_000
+        )
+        farming_contract.claimDistribution(
+            sp.record(distribution_id=0, amount=3_000_000, proof=[bob_leaf]),
+            _sender=Address.alice,
+            _now=sp.timestamp(1320),
+            _valid=False,
+            _exception="AlreadyClaimed",
+        )
+        farming_contract.claimDistribution(
+            sp.record(distribution_id=0, amount=2_000_000, proof=[alice_leaf]),
+            _sender=Address.bob,
+            _now=sp.timestamp(1320),
+            _valid=False,
+            _exception="InvalidProof",
+        )
+        farming_contract.claimDistribution(
+            sp.record(distribution_id=0, amount=1_000_000, proof=[alice_leaf]),
+            _sender=Address.bob,
+            _now=sp.timestamp(1320),
+        )
+        sc.verify(farming_contract.data.distributions[0].claimed == 4_000_000)
+
+        # The unclaimed rest of an expired distribution goes back to the
+        # administrator
+        farming_contract.publishDistribution(
+            sp.record(
+                farm_id=10,
+                merkle_root=merkle_root,
+                total=4_000_000,
+                expiry=sp.timestamp(1400),
+            ),
+            _sender=Address.admin,
+            _now=sp.timestamp(1300),
+        )
+        farming_contract.claimDistribution(
+            sp.record(distribution_id=1, amount=3_000_000, proof=[bob_leaf]),
+            _sender=Address.alice,
+            _now=sp.timestamp(1310),
+        )
+        farming_contract.reclaimDistribution(
+            1,
+            _sender=Address.admin,
+            _now=sp.timestamp(1390),
+            _valid=False,
+            _exception="DistributionNotExpired",
+        )
+        farming_contract.reclaimDistribution(
+            1,
+            _sender=Address.alice,
+            _now=sp.timestamp(1400),
+            _valid=False,
+            _exception="NotAdmin",
+        )
+        farming_contract.claimDistribution(
+            sp.record(distribution_id=1, amount=1_000_000, proof=[alice_leaf]),
+            _sender=Address.bob,
+            _now=sp.timestamp(1400),
+            _valid=False,
+            _exception="DistributionExpired",
+        )
+        admin_rewards = sc.compute(reward_token.data.ledger[(Address.admin, 0)])
+        farming_contract.reclaimDistribution(
+            1, _sender=Address.admin, _now=sp.timestamp(1400)
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.admin, 0)] == admin_rewards + 1_000_000
+        )
+        sc.verify(farming_contract.data.distributions[1].claimed == 4_000_000)
+        farming_contract.reclaimDistribution(
+            1,
+            _sender=Address.admin,
+            _now=sp.timestamp(1500),
+            _valid=False,
+            _exception="DistributionExhausted",
+        )
+
+        # Repeated senders and receivers in one batch are settled once
+        sc.h2("Batched Token Transfer")
+        alice_tokens = sc.compute(token.data.ledger[(Address.alice, 0)])
+        bob_tokens = sc.compute(token.data.ledger[(Address.bob, 0)])
+        token.transfer(
+            [
+                sp.record(
+                    from_=Address.alice,
+                    txs=[
+                        sp.record(to_=Address.bob, token_id=0, amount=1_000),
+                        sp.record(to_=Address.bob, token_id=0, amount=2_000),
+                        sp.record(to_=Address.alice, token_id=0, amount=500),
+                    ],
+                ),
+                sp.record(
+                    from_=Address.bob,
+                    txs=[sp.record(to_=Address.alice, token_id=0, amount=1_000)],
+                ),
+            ],
+            _sender=Address.alice,
+            _valid=False,
+            _exception="FA2_NOT_OPERATOR",
+        )
+        token.transfer(
+            [
+                sp.record(
+                    from_=Address.alice,
+                    txs=[
+                        sp.record(to_=Address.bob, token_id=0, amount=1_000),
+                        sp.record(to_=Address.bob, token_id=0, amount=2_000),
+                        sp.record(to_=Address.alice, token_id=0, amount=500),
+                    ],
+                )
+            ],
+            _sender=Address.alice,
+        )
+        sc.verify(token.data.ledger[(Address.alice, 0)] + 3_000 == alice_tokens)
+        sc.verify(token.data.ledger[(Address.bob, 0)] == bob_tokens + 3_000)
+        token.transfer(
+            [
+                sp.record(
+                    from_=Address.bob,
+                    txs=[sp.record(to_=Address.alice, token_id=0, amount=3_000)],
+                )
+            ],
+            _sender=Address.bob,
+        )
+        sc.verify(token.data.ledger[(Address.alice, 0)] == alice_tokens)
+
+        # Token balances are read with the off-chain views, and their on-chain
+        # counterparts return the same values
+        sc.h2("Token Views")
+        alice_balance = sp.record(owner=Address.alice, token_id=0)
+        sc.verify(
+            token.get_balance(alice_balance) == token.data.ledger[(Address.alice, 0)]
+        )
+        sc.verify(
+            token.get_balance_onchain(alice_balance) == token.get_balance(alice_balance)
+        )
+        balances = sc.compute(
+            reward_token.get_balances(
+                [
+                    sp.record(owner=farming_contract.address, token_id=0),
+                    sp.record(owner=Address.alice, token_id=0),
+                ]
+            )
+        )
+        sc.verify(sp.len(balances) == 2)
+        sc.show(balances)
+        sc.verify(token.total_supply(sp.record(token_id=0)) == token.data.supply[0])
+        sc.verify(
+            token.total_supply_onchain(sp.record(token_id=0)) == token.data.supply[0]
+        )
+        alice_operator = sp.record(
+            owner=Address.alice,
+            operator=farming_contract.address,
+            token_id=0,
+        )
+        sc.verify(token.is_operator(alice_operator))
+        sc.verify(token.is_operator_onchain(alice_operator))
+
+        # Deposits and withdrawals reset the reward debt for the new amount, or
+        # the next harvest pays the rewards of the change since the start
+        sc.h2("Reward Debt after a Deposit and a Withdrawal")
+        farming_contract.createFarm(
+            sp.record(
+                pool_token=createFarmParams.pool_token,
+                reward_token=createFarmParams.reward_token,
+                reward_supply=sp.nat(100_000_000),
+                start_time=sp.timestamp(2000),
+                end_time=sp.timestamp(2100),
+                lock_duration=sp.nat(0),
+                payout_threshold=None,
+                precision=None,
+                bonuses=set(),
+            ),
+            _sender=Address.admin,
+            _now=sp.timestamp(1400),
+        )
+        alice_rewards = sc.compute(reward_token.data.ledger[(Address.alice, 0)])
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(11), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(2000),
+        )
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(11), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(2010),
+        )
+        sc.verify(
+            farming_contract.data.ledger[(11, Address.alice)].reward_debt
+            == farming_contract.data.farm_states[11].acc_reward_per_share
+            * 2_000_000
+            / 1_000_000_000_000
+        )
+        farming_contract.harvest(
+            sp.nat(11), _sender=Address.alice, _now=sp.timestamp(2020)
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 20_000_000
+        )
+        farming_contract.withdraw(
+            sp.record(farm_id=sp.nat(11), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(2030),
+        )
+        farming_contract.harvest(
+            sp.nat(11), _sender=Address.alice, _now=sp.timestamp(2040)
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.alice, 0)] == alice_rewards + 40_000_000
+        )
+
+        # An ended farm sends its rewards back once, and takes no more deposits
+        # even before its end time
+        sc.h2("End Farm 12 before its End Time")
+        farming_contract.createFarm(
+            sp.record(
+                pool_token=createFarmParams.pool_token,
+                reward_token=createFarmParams.reward_token,
+                reward_supply=sp.nat(100_000_000),
+                start_time=sp.timestamp(2200),
+                end_time=sp.timestamp(2300),
+                lock_duration=sp.nat(0),
+                payout_threshold=None,
+                precision=None,
+                bonuses=set(),
+            ),
+            _sender=Address.admin,
+            _now=sp.timestamp(2100),
+        )
+        admin_rewards = sc.compute(reward_token.data.ledger[(Address.admin, 0)])
+        farming_contract.endFarm(
+            sp.nat(12), _sender=Address.admin, _now=sp.timestamp(2250)
+        )
+        sc.verify(farming_contract.data.farm_states[12].ended)
+        sc.verify(
+            reward_token.data.ledger[(Address.admin, 0)] == admin_rewards + 100_000_000
+        )
+        farming_contract.endFarm(
+            sp.nat(12),
+            _sender=Address.admin,
+            _now=sp.timestamp(2260),
+            _valid=False,
+            _exception="FarmEnded",
+        )
+        farming_contract.deposit(
+            sp.record(farm_id=sp.nat(12), token_amount=sp.nat(1_000_000)),
+            _sender=Address.alice,
+            _now=sp.timestamp(2260),
+            _valid=False,
+            _exception="FarmEnded",
+        )
+        farming_contract.migrateStake(
+            sp.record(from_farm=11, to_farm=12, token_amount=1_000_000),
+            _sender=Address.alice,
+            _now=sp.timestamp(2260),
+            _valid=False,
+            _exception="FarmEnded",
+        )
+        sc.verify(
+            reward_token.data.ledger[(Address.admin, 0)] == admin_rewards + 100_000_000
+        )
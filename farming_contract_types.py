@@ -10,56 +10,144 @@ def farming_types():
         paused=sp.bool,
     )
 
-    # Farm bigmap value type
+    # Token descriptor type
+    token_type: type = sp.record(
+        address=sp.address,
+        token_id=sp.nat,
+        token_type=sp.variant(fa12=sp.unit, fa2=sp.unit),
+    )
+
+    # Reward stream state, for the reward tokens added next to the farm reward
+    # token. Streams share the bonus epochs of the farm.
+    reward_stream_state_type: type = sp.record(
+        reward_token=token_type,
+        reward_supply=sp.nat,
+        reward_paid=sp.nat,
+        reward_per_second=sp.nat,
+        acc_reward_per_share=sp.nat,
+    )
+
+    # Reward stream config, `owner` gets back the rewards left when the farm ends
+    reward_stream_config_type: type = sp.record(
+        owner=sp.address,
+    )
+
+    # Reward stream position of a user
+    reward_stream_position_type: type = sp.record(
+        reward_debt=sp.nat,
+        unclaimed=sp.nat,
+    )
+
+    # Farm view type, assembled from the farm state, config and bonuses
     farm_type: type = sp.record(
-        pool_token=sp.record(
-            address=sp.address,
-            token_id=sp.nat,
-            token_type=sp.variant(fa12=sp.unit, fa2=sp.unit),
-        ),
+        pool_token=token_type,
         pool_balance=sp.nat,
-        reward_token=sp.record(
-            address=sp.address,
-            token_id=sp.nat,
-            token_type=sp.variant(fa12=sp.unit, fa2=sp.unit),
-        ),
+        reward_token=token_type,
         reward_supply=sp.nat,
         reward_paid=sp.nat,
         last_reward_time=sp.timestamp,
         acc_reward_per_share=sp.nat,
+        precision=sp.nat,
         reward_per_second=sp.nat,
         start_time=sp.timestamp,
         end_time=sp.timestamp,
         lock_duration=sp.nat,
+        payout_threshold=sp.option[sp.nat],
         bonuses=sp.set[sp.record(end_time=sp.timestamp, multipier=sp.nat)],
         owner=sp.address,
+        streams=sp.map[sp.nat, reward_stream_state_type],
+        ended=sp.bool,
+    )
+
+    # Farm epoch bigmap value type. A bonus multiplies the reward rate of its
+    # epoch, `cumulative_weight` is the sum of the multiplied seconds from the
+    # start of the farm to the end of the epoch.
+    farm_epoch_type: type = sp.record(
+        index=sp.nat,
+        end_time=sp.timestamp,
+        multiplier=sp.nat,
+        cumulative_weight=sp.nat,
+    )
+
+    # Farm state bigmap value type, updated on every deposit, harvest and withdraw.
+    # It holds everything these entrypoints read, so that they never load the
+    # farm config. With a payout threshold, deposits and withdrawals keep the
+    # rewards in the ledger until they reach the threshold.
+    farm_state_type: type = sp.record(
+        pool_token=token_type,
+        reward_token=token_type,
+        lock_duration=sp.nat,
+        payout_threshold=sp.option[sp.nat],
+        pool_balance=sp.nat,
+        reward_supply=sp.nat,
+        reward_paid=sp.nat,
+        last_reward_time=sp.timestamp,
+        acc_reward_per_share=sp.nat,
+        reward_per_second=sp.nat,
+        start_time=sp.timestamp,
+        end_time=sp.timestamp,
+        epoch=farm_epoch_type,
+        last_epoch_index=sp.nat,
+        streams=sp.map[sp.nat, reward_stream_state_type],
+        precision=sp.nat,
+        ended=sp.bool,
+    )
+
+    # Farm config bigmap value type, the owners of the farm and of its reward
+    # streams. Only read by the owner entrypoints.
+    farm_config_type: type = sp.record(
+        owner=sp.address,
+        streams=sp.map[sp.nat, reward_stream_config_type],
     )
 
-    # Create farm entrypoint params type
+    # Create farm entrypoint params type. `precision` scales the reward
+    # accumulators of the farm, 10^12 when not set. A lower precision keeps the
+    # accumulators small for large reward supplies over small pools.
     create_farm_params_type: type = sp.record(
-        pool_token=sp.record(
-            address=sp.address,
-            token_id=sp.nat,
-            token_type=sp.variant(fa12=sp.unit, fa2=sp.unit),
-        ),
-        reward_token=sp.record(
-            address=sp.address,
-            token_id=sp.nat,
-            token_type=sp.variant(fa12=sp.unit, fa2=sp.unit),
-        ),
+        pool_token=token_type,
+        reward_token=token_type,
         reward_supply=sp.nat,
         start_time=sp.timestamp,
         end_time=sp.timestamp,
         lock_duration=sp.nat,
+        payout_threshold=sp.option[sp.nat],
+        precision=sp.option[sp.nat],
         bonuses=sp.set[sp.record(end_time=sp.timestamp, multipier=sp.nat)],
     )
 
+    # Pool token index bigmap key type, the pool token address and token id
+    pool_token_key_type: type = sp.pair[sp.address, sp.nat]
+
+    # Farm factory registry bigmap value type, the farm contract originated for
+    # a farm and the data needed to find it
+    farm_registry_type: type = sp.record(
+        address=sp.address,
+        pool_token=token_type,
+        reward_token=token_type,
+        owner=sp.address,
+    )
+
+    # Distribution bigmap value type. The leaves of the merkle tree are the
+    # blake2b hashes of the packed `(user, amount)` pairs. Claims are accepted
+    # until `expiry`, after which the administrator reclaims the rest.
+    distribution_type: type = sp.record(
+        farm_id=sp.nat,
+        merkle_root=sp.bytes,
+        total=sp.nat,
+        claimed=sp.nat,
+        expiry=sp.timestamp,
+    )
+
     # Ledger bigmap key type
     ledger_key_type: type = sp.pair[sp.nat, sp.address]
 
     # Ledger bigmap value type
     ledger_value_type: type = sp.record(
-        amount=sp.nat, reward_debt=sp.nat, lock_end_time=sp.timestamp
+        amount=sp.nat,
+        reward_debt=sp.nat,
+        lock_end_time=sp.timestamp,
+        unclaimed=sp.nat,
+        streams=sp.map[sp.nat, reward_stream_position_type],
     )
 
     # Transfer FA2 token entrypoint params type
@@ -96,5 +184,157 @@ def farming_types():
         from_=sp.address, to_=sp.address, value=sp.nat
     ).layout(("from_ as from", ("to_ as to", "value")))
 
-    # Deposit entrypoint params type
-    deposit_params_type: type = sp.record(farm_id=sp.nat, token_amount=sp.nat)
+    # Pending token transfers of an entrypoint call, grouped by token contract
+    pending_transfers_type: type = sp.record(
+        fa2=sp.map[
+            sp.address,
+            sp.map[
+                sp.record(from_=sp.address, to_=sp.address, token_id=sp.nat), sp.nat
+            ],
+        ],
+        fa12=sp.map[
+            sp.record(token_address=sp.address, from_=sp.address, to_=sp.address),
+            sp.nat,
+        ],
+    )
+
+    # Deposit and withdraw entrypoints params type, a token amount of a farm
+    farm_amount_params_type: type = sp.record(farm_id=sp.nat, token_amount=sp.nat)
+
+    # Migrate stake entrypoint params type
+    migrate_stake_params_type: type = sp.record(
+        from_farm=sp.nat, to_farm=sp.nat, token_amount=sp.nat
+    )
+
+    # Add reward stream entrypoint params type
+    add_reward_stream_params_type: type = sp.record(
+        farm_id=sp.nat, reward_token=token_type, reward_supply=sp.nat
+    )
+
+    # Publish distribution entrypoint params type
+    publish_distribution_params_type: type = sp.record(
+        farm_id=sp.nat, merkle_root=sp.bytes, total=sp.nat, expiry=sp.timestamp
+    )
+
+    # Claim distribution entrypoint params type, `proof` lists the sibling
+    # hashes from the leaf to the root
+    claim_distribution_params_type: type = sp.record(
+        distribution_id=sp.nat, amount=sp.nat, proof=sp.list[sp.bytes]
+    )
+
+    # Reward stream state carried by the events, after the operation
+    stream_event_state_type: type = sp.record(
+        reward_paid=sp.nat,
+        acc_reward_per_share=sp.nat,
+    )
+
+    # Farm state carried by the events, after the operation
+    farm_event_state_type: type = sp.record(
+        pool_balance=sp.nat,
+        reward_paid=sp.nat,
+        acc_reward_per_share=sp.nat,
+        last_reward_time=sp.timestamp,
+        streams=sp.map[sp.nat, stream_event_state_type],
+    )
+
+    # FarmCreated event type
+    farm_created_event_type: type = sp.record(
+        version=sp.nat,
+        farm_id=sp.nat,
+        pool_token=token_type,
+        reward_token=token_type,
+        reward_supply=sp.nat,
+        reward_per_second=sp.nat,
+        precision=sp.nat,
+        start_time=sp.timestamp,
+        end_time=sp.timestamp,
+        lock_duration=sp.nat,
+        payout_threshold=sp.option[sp.nat],
+        owner=sp.address,
+    )
+
+    # Harvested event type, `stream_rewards` are the rewards paid by each reward
+    # stream
+    harvested_event_type: type = sp.record(
+        version=sp.nat,
+        farm_id=sp.nat,
+        user=sp.address,
+        reward=sp.nat,
+        stream_rewards=sp.map[sp.nat, sp.nat],
+        farm=farm_event_state_type,
+        position=ledger_value_type,
+    )
+
+    # TokensDeposited and TokensWithdrawn event type, `reward` and
+    # `stream_rewards` are the rewards harvested by the same operation
+    tokens_event_type: type = sp.record(
+        version=sp.nat,
+        farm_id=sp.nat,
+        user=sp.address,
+        amount=sp.nat,
+        reward=sp.nat,
+        stream_rewards=sp.map[sp.nat, sp.nat],
+        farm=farm_event_state_type,
+        position=ledger_value_type,
+    )
+
+    # EmergencyWithdrawn event type, the position is removed by the operation
+    emergency_withdrawn_event_type: type = sp.record(
+        version=sp.nat,
+        farm_id=sp.nat,
+        user=sp.address,
+        amount=sp.nat,
+        farm=farm_event_state_type,
+    )
+
+    # FarmOriginated event type, emitted by the farm factory
+    farm_originated_event_type: type = sp.record(
+        version=sp.nat,
+        farm_id=sp.nat,
+        address=sp.address,
+        pool_token=token_type,
+        reward_token=token_type,
+        owner=sp.address,
+    )
+
+    # DistributionPublished event type
+    distribution_published_event_type: type = sp.record(
+        version=sp.nat,
+        distribution_id=sp.nat,
+        farm_id=sp.nat,
+        merkle_root=sp.bytes,
+        total=sp.nat,
+        expiry=sp.timestamp,
+    )
+
+    # DistributionClaimed event type
+    distribution_claimed_event_type: type = sp.record(
+        version=sp.nat,
+        distribution_id=sp.nat,
+        farm_id=sp.nat,
+        user=sp.address,
+        amount=sp.nat,
+    )
+
+    # DistributionReclaimed event type, `amount` is the unclaimed rest
+    distribution_reclaimed_event_type: type = sp.record(
+        version=sp.nat,
+        distribution_id=sp.nat,
+        farm_id=sp.nat,
+        amount=sp.nat,
+    )
+
+    # FarmEnded event type
+    farm_ended_event_type: type = sp.record(version=sp.nat, farm_id=sp.nat)
+
+    # RewardStreamAdded event type
+    reward_stream_added_event_type: type = sp.record(
+        version=sp.nat,
+        farm_id=sp.nat,
+        stream_id=sp.nat,
+        reward_token=token_type,
+        reward_supply=sp.nat,
+        reward_per_second=sp.nat,
+        owner=sp.address,
+        farm=farm_event_state_type,
+    )
@@ -0,0 +1,210 @@
+import os
+import random
+import tempfile
+from indexer import Indexer, JsonEventLog
+
+# Indexer test on a generated event log, from version 1, 2 and 6 events, and
+# version 7 distribution and version 8 reward stream events.
+#
+# The log is ingested at once in one database and in several interrupted runs
+# in another one. Both must match the balances computed from the events.
+
+
+def generate_events(rng, farms, users, count):
+    """Generate a log of version 1 events, then version 2 and version 6 ones.
+
+    Returns the events, the staked amounts and the last unclaimed rewards of
+    the positions seen in version 6 events.
+    """
+    events = []
+    amounts = {}
+    unclaimed = {}
+    level = 1
+
+    def emit(tag, **payload):
+        events.append(dict(id=len(events), level=level, tag=tag, payload=payload))
+
+    def post_state(tag, **payload):
+        farm_id = payload["farm_id"]
+        if len(events) < count // 2:
+            return {key: str(value) for key, value in payload.items()}
+        pool_balance = sum(
+            amount for (farm, _), amount in amounts.items() if farm == farm_id
+        )
+        farm = dict(
+            pool_balance=str(pool_balance),
+            reward_paid="0",
+            acc_reward_per_share=str(level * 10**20),
+            last_reward_time=str(level),
+        )
+        position_key = (farm_id, payload["user"])
+        position = dict(
+            amount=str(amounts.get(position_key, 0)),
+            reward_debt=str(level),
+            lock_end_time="0",
+        )
+        state = dict(farm=farm, position=position)
+        version = "2"
+        if len(events) >= count * 3 // 4:
+            version = "6"
+            farm["streams"] = {}
+            state["stream_rewards"] = {}
+            unclaimed[position_key] = level % 7
+            position.update(unclaimed=str(unclaimed[position_key]), streams={})
+        if tag == "EmergencyWithdrawn":
+            unclaimed[position_key] = 0
+            state = dict(farm=farm) if version == "6" else {}
+        return dict(
+            {key: str(value) for key, value in payload.items()},
+            version=version,
+            **state,
+        )
+
+    for farm_id in range(farms):
+        emit("FarmCreated", farm_id=str(farm_id))
+    while len(events) < count:
+        level += rng.randint(0, 2)
+        farm_id = rng.randrange(farms)
+        user = "tz1user%d" % rng.randrange(users)
+        staked = amounts.get((farm_id, user), 0)
+        reward = rng.randint(0, 100) if staked > 0 else 0
+        if staked > 0 and rng.random() < 0.05:
+            amounts[(farm_id, user)] = 0
+            emit(
+                "EmergencyWithdrawn",
+                **post_state(
+                    "EmergencyWithdrawn", farm_id=farm_id, user=user, amount=staked
+                ),
+            )
+            continue
+        if staked > 0:
+            emit(
+                "Harvested",
+                **post_state("Harvested", farm_id=farm_id, user=user, reward=reward),
+            )
+        if staked > 0 and rng.random() < 0.5:
+            amount = rng.randint(1, staked)
+            tag = "TokensWithdrawn"
+            amounts[(farm_id, user)] = staked - amount
+        else:
+            amount = rng.randint(1, 1_000)
+            tag = "TokensDeposited"
+            amounts[(farm_id, user)] = staked + amount
+        emit(
+            tag,
+            **post_state(tag, farm_id=farm_id, user=user, amount=amount, reward=reward),
+        )
+    # Adding a reward stream accrues the farm up to its start
+    level += 1
+    for farm_id in range(farms):
+        pool_balance = sum(
+            amount for (farm, _), amount in amounts.items() if farm == farm_id
+        )
+        emit(
+            "RewardStreamAdded",
+            version="8",
+            farm_id=str(farm_id),
+            stream_id="0",
+            reward_supply="1000",
+            reward_per_second="10",
+            farm=dict(
+                pool_balance=str(pool_balance),
+                reward_paid="0",
+                acc_reward_per_share=str(level * 10**20),
+                last_reward_time=str(level),
+                streams={},
+            ),
+        )
+    # Distribution events carry a user but update no farm or position
+    for farm_id in range(farms):
+        emit(
+            "DistributionPublished",
+            version="7",
+            distribution_id=str(farm_id),
+            farm_id=str(farm_id),
+            merkle_root="0x00",
+            total="100",
+            expiry=str(level + 100),
+        )
+        emit(
+            "DistributionClaimed",
+            version="7",
+            distribution_id=str(farm_id),
+            farm_id=str(farm_id),
+            user="tz1user0",
+            amount="60",
+        )
+        emit(
+            "DistributionReclaimed",
+            version="7",
+            distribution_id=str(farm_id),
+            farm_id=str(farm_id),
+            amount="40",
+        )
+    for farm_id in range(farms):
+        emit("FarmEnded", farm_id=str(farm_id))
+    return events, amounts, unclaimed
+
+
+if __name__ == "__main__":
+    rng = random.Random(0)
+    events, amounts, unclaimed = generate_events(rng, farms=3, users=20, count=2_000)
+    with tempfile.TemporaryDirectory() as directory:
+        log = JsonEventLog(os.path.join(directory, "events.jsonl"))
+
+        # Ingest the whole log at once
+        log.append(events)
+        full = Indexer(os.path.join(directory, "full.db"))
+        assert full.sync(log) == len(events)
+        assert full.sync(log) == 0
+
+        # Ingest the log while it grows, reopening the database between runs
+        log = JsonEventLog(os.path.join(directory, "growing.jsonl"))
+        db_path = os.path.join(directory, "resumed.db")
+        for start in range(0, len(events), 300):
+            log.append(events[start : start + 300])
+            resumed = Indexer(db_path)
+            resumed.sync(log, batch_size=64)
+            resumed.close()
+        resumed = Indexer(db_path)
+        assert resumed.last_id == full.last_id == events[-1]["id"]
+
+        stream_added = {
+            int(event["payload"]["farm_id"]): event["payload"]["farm"]
+            for event in events
+            if event["tag"] == "RewardStreamAdded"
+        }
+        for farm_id in range(3):
+            tvl = sum(
+                amount for (farm, _), amount in amounts.items() if farm == farm_id
+            )
+            for indexer in [full, resumed]:
+                farm = indexer.farm(farm_id)
+                assert farm["tvl"] == tvl
+                assert farm["created_level"] == 1
+                assert farm["ended_level"] is not None
+                assert int(farm["acc_reward_per_share"]) > 2**64
+                assert (
+                    farm["last_reward_time"]
+                    == stream_added[farm_id]["last_reward_time"]
+                )
+        for (farm_id, user), value in unclaimed.items():
+            assert full.position(farm_id, user)["unclaimed"] == value
+        for (farm_id, user), amount in amounts.items():
+            assert full.position(farm_id, user)["amount"] == amount
+            assert full.position(farm_id, user)["reward_debt"] is not None
+            assert tuple(full.position(farm_id, user)) == tuple(
+                resumed.position(farm_id, user)
+            )
+        rewards = sum(
+            int(event["payload"]["reward"])
+            for event in events
+            if event["tag"] == "Harvested"
+        )
+        for indexer in [full, resumed]:
+            assert (
+                indexer.db.execute("SELECT SUM(rewards_paid) FROM farms").fetchone()[0]
+                == rewards
+            )
+            indexer.close()
+    print("Indexer OK")
@@ -0,0 +1,4 @@
+from indexer.source import JsonEventLog
+from indexer.store import Indexer
+
+__all__ = ["Indexer", "JsonEventLog"]
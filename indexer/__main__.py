@@ -0,0 +1,16 @@
+import argparse
+from indexer import Indexer, JsonEventLog
+
+# Usage:
+#   python -m indexer events.jsonl --db farming.db
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Farming contract event indexer")
+    parser.add_argument("events", help="JSON lines event log")
+    parser.add_argument("--db", default="farming.db", help="SQLite database")
+    parser.add_argument("--batch-size", type=int, default=1_000)
+    args = parser.parse_args()
+    indexer = Indexer(args.db)
+    count = indexer.sync(JsonEventLog(args.events), batch_size=args.batch_size)
+    print("Indexed %d events up to id %d" % (count, indexer.last_id))
+    indexer.close()
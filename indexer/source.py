@@ -0,0 +1,34 @@
+import json
+
+# Event source standing in for a node or indexer API.
+#
+# Events are stored one JSON object per line, in the shape of the TzKT
+# contract events API:
+#   {"id": 12, "level": 340, "tag": "TokensDeposited",
+#    "payload": {"farm_id": "0", "user": "tz1...", "amount": "1000"}}
+# Ids grow with the order in which the events were emitted.
+
+
+class JsonEventLog:
+    """Append-only JSON lines file of contract events."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, events):
+        with open(self.path, "a") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+
+    def events(self, after_id=-1):
+        """Yield the events with an id greater than `after_id`, in order."""
+        try:
+            f = open(self.path)
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                if line.strip():
+                    event = json.loads(line)
+                    if event["id"] > after_id:
+                        yield event
@@ -0,0 +1,306 @@
+import itertools
+import json
+import sqlite3
+
+# SQLite store of the farming contract events.
+#
+# Raw events are kept in `events`. The `farms` and `positions` tables are
+# materialized views updated with each batch of events, in the same
+# transaction as the checkpoint, so an interrupted sync resumes from the last
+# committed batch without counting an event twice.
+#
+# Version 1 events only carry amounts, which are applied as deltas. Version 2
+# events carry the farm and position state after the operation, which is
+# copied as is. Version 3 adds the payout threshold of the farm and the
+# unclaimed rewards of the position. Version 4 adds the reward stream states
+# and the stream rewards, which are kept in the raw events only. Version 5
+# adds the accumulator precision of the farm. EmergencyWithdrawn events carry
+# the farm state from version 6, and no position since it is removed.
+# RewardStreamAdded events carry the farm state from version 8.
+# `acc_reward_per_share` does not fit in an SQLite integer and is stored as
+# text.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoint (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    level INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    farm_id INTEGER NOT NULL,
+    user TEXT,
+    amount INTEGER,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_farm ON events (farm_id, tag);
+CREATE TABLE IF NOT EXISTS farms (
+    farm_id INTEGER PRIMARY KEY,
+    created_level INTEGER,
+    ended_level INTEGER,
+    tvl INTEGER NOT NULL DEFAULT 0,
+    rewards_paid INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS positions (
+    farm_id INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    amount INTEGER NOT NULL DEFAULT 0,
+    rewards INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (farm_id, user)
+);
+"""
+
+# Columns added after the first schema, applied once per database
+MIGRATIONS = [
+    """
+    ALTER TABLE farms ADD COLUMN pool_token TEXT;
+    ALTER TABLE farms ADD COLUMN reward_token TEXT;
+    ALTER TABLE farms ADD COLUMN reward_supply INTEGER;
+    ALTER TABLE farms ADD COLUMN reward_per_second INTEGER;
+    ALTER TABLE farms ADD COLUMN start_time TEXT;
+    ALTER TABLE farms ADD COLUMN end_time TEXT;
+    ALTER TABLE farms ADD COLUMN owner TEXT;
+    ALTER TABLE farms ADD COLUMN acc_reward_per_share TEXT;
+    ALTER TABLE farms ADD COLUMN last_reward_time TEXT;
+    ALTER TABLE positions ADD COLUMN reward_debt INTEGER;
+    """,
+    """
+    ALTER TABLE farms ADD COLUMN payout_threshold INTEGER;
+    ALTER TABLE positions ADD COLUMN unclaimed INTEGER;
+    """,
+    """
+    ALTER TABLE farms ADD COLUMN precision INTEGER;
+    """,
+]
+
+FARM_COLUMNS = [
+    "farm_id",
+    "created_level",
+    "ended_level",
+    "tvl",
+    "rewards_paid",
+    "pool_token",
+    "reward_token",
+    "reward_supply",
+    "reward_per_second",
+    "start_time",
+    "end_time",
+    "owner",
+    "acc_reward_per_share",
+    "last_reward_time",
+    "payout_threshold",
+    "precision",
+]
+
+POSITION_COLUMNS = [
+    "farm_id",
+    "user",
+    "amount",
+    "rewards",
+    "reward_debt",
+    "unclaimed",
+]
+
+
+def upsert(table, columns, keys):
+    return "INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) DO UPDATE SET %s" % (
+        table,
+        ", ".join(columns),
+        ", ".join(":" + column for column in columns),
+        ", ".join(keys),
+        ", ".join(
+            "%s = excluded.%s" % (column, column)
+            for column in columns
+            if column not in keys
+        ),
+    )
+
+
+# Events updating a position, the other ones such as RewardStreamAdded or the
+# distribution events do not have a view
+POSITION_TAGS = [
+    "TokensDeposited",
+    "TokensWithdrawn",
+    "Harvested",
+    "Compounded",
+    "EmergencyWithdrawn",
+]
+
+UPSERT_FARM = upsert("farms", FARM_COLUMNS, ["farm_id"])
+UPSERT_POSITION = upsert("positions", POSITION_COLUMNS, ["farm_id", "user"])
+
+
+def token_key(token):
+    return "%s:%s" % (token["address"], token["token_id"])
+
+
+def farm_state(farm):
+    """Return the farm columns of the farm state of an event."""
+    return dict(
+        tvl=int(farm["pool_balance"]),
+        acc_reward_per_share=farm["acc_reward_per_share"],
+        last_reward_time=farm["last_reward_time"],
+    )
+
+
+class Indexer:
+    """Ingest farming contract events into a SQLite database."""
+
+    def __init__(self, db_path, name="farming"):
+        self.name = name
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        for migration in MIGRATIONS[version:]:
+            self.db.executescript(migration)
+        self.db.execute("PRAGMA user_version = %d" % len(MIGRATIONS))
+
+    def close(self):
+        self.db.close()
+
+    @property
+    def last_id(self):
+        row = self.db.execute(
+            "SELECT last_id FROM checkpoint WHERE name = ?", (self.name,)
+        ).fetchone()
+        return -1 if row is None else row["last_id"]
+
+    def sync(self, source, batch_size=1_000):
+        """Ingest the events of `source` after the checkpoint.
+
+        Returns the number of ingested events.
+        """
+        count = 0
+        events = source.events(self.last_id)
+        while True:
+            batch = list(itertools.islice(events, batch_size))
+            if not batch:
+                return count
+            with self.db:
+                self.apply(batch)
+            count += len(batch)
+
+    def _load(self, cache, key, default):
+        if key not in cache:
+            if len(key) == 1:
+                row = self.farm(*key)
+            else:
+                row = self.position(*key)
+            cache[key] = default if row is None else dict(row)
+        return cache[key]
+
+    def apply(self, batch):
+        # Rows are updated in memory so each farm and position is written
+        # once per batch
+        farms = {}
+        positions = {}
+        rows = []
+        for event in batch:
+            tag = event["tag"]
+            payload = event["payload"]
+            version = int(payload.get("version", 1))
+            farm_id = int(payload["farm_id"])
+            user = payload.get("user")
+            amount = payload.get("amount", payload.get("reward"))
+            rows.append(
+                (
+                    event["id"],
+                    event["level"],
+                    tag,
+                    farm_id,
+                    user,
+                    None if amount is None else int(amount),
+                    json.dumps(payload),
+                )
+            )
+            farm = self._load(
+                farms,
+                (farm_id,),
+                dict(
+                    dict.fromkeys(FARM_COLUMNS), farm_id=farm_id, tvl=0, rewards_paid=0
+                ),
+            )
+            if tag == "FarmCreated":
+                farm["created_level"] = event["level"]
+                if version >= 2:
+                    farm.update(
+                        pool_token=token_key(payload["pool_token"]),
+                        reward_token=token_key(payload["reward_token"]),
+                        reward_supply=int(payload["reward_supply"]),
+                        reward_per_second=int(payload["reward_per_second"]),
+                        start_time=payload["start_time"],
+                        end_time=payload["end_time"],
+                        owner=payload["owner"],
+                        acc_reward_per_share="0",
+                        last_reward_time=payload["start_time"],
+                    )
+                if version >= 3:
+                    farm["payout_threshold"] = payload["payout_threshold"]
+                if version >= 5:
+                    farm["precision"] = int(payload["precision"])
+                continue
+            if tag == "FarmEnded":
+                farm["ended_level"] = event["level"]
+                continue
+            if tag == "RewardStreamAdded":
+                if version >= 8:
+                    farm.update(farm_state(payload["farm"]))
+                continue
+            if tag not in POSITION_TAGS:
+                continue
+            position = self._load(
+                positions,
+                (farm_id, user),
+                dict(
+                    dict.fromkeys(POSITION_COLUMNS),
+                    farm_id=farm_id,
+                    user=user,
+                    amount=0,
+                    rewards=0,
+                ),
+            )
+            # Deposits and withdrawals also report the reward of the Harvested
+            # event they emitted first
+            if tag in ["Harvested", "Compounded"]:
+                farm["rewards_paid"] += int(payload["reward"])
+                position["rewards"] += int(payload["reward"])
+            # Emergency withdrawals only carry the farm state from version 6
+            if version >= 6 or (version >= 2 and tag != "EmergencyWithdrawn"):
+                farm.update(farm_state(payload["farm"]))
+            elif tag == "EmergencyWithdrawn":
+                farm["tvl"] -= int(amount)
+            if tag == "EmergencyWithdrawn":
+                position.update(amount=0, reward_debt=0, unclaimed=0)
+            elif version >= 2:
+                position.update(
+                    amount=int(payload["position"]["amount"]),
+                    reward_debt=int(payload["position"]["reward_debt"]),
+                )
+                if version >= 3:
+                    position["unclaimed"] = int(payload["position"]["unclaimed"])
+            elif tag == "TokensDeposited":
+                farm["tvl"] += int(amount)
+                position["amount"] += int(amount)
+            elif tag == "TokensWithdrawn":
+                farm["tvl"] -= int(amount)
+                position["amount"] -= int(amount)
+        self.db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.executemany(UPSERT_FARM, farms.values())
+        self.db.executemany(UPSERT_POSITION, positions.values())
+        self.db.execute(
+            "INSERT INTO checkpoint VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id",
+            (self.name, batch[-1]["id"]),
+        )
+
+    def farm(self, farm_id):
+        return self.db.execute(
+            "SELECT * FROM farms WHERE farm_id = ?", (farm_id,)
+        ).fetchone()
+
+    def position(self, farm_id, user):
+        return self.db.execute(
+            "SELECT * FROM positions WHERE farm_id = ? AND user = ?", (farm_id, user)
+        ).fetchone()
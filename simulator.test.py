@@ -0,0 +1,216 @@
+import argparse
+import random
+import smartpy as sp  # type: ignore
+from farming import farming_contract_module
+from farming_contract_types import farming_types
+from simulator import FarmSimulator
+from utilities.fa2_fungible_minimal import fa2_fungible
+
+# Differential test of the off-chain reward simulator.
+#
+# Each sample draws a farm (supply, duration, bonuses, precision) and a random
+# timeline of batched deposits, harvests and withdrawals. The timeline is
+# replayed on the simulator and on the contract, then farm states, positions
+# and the rewards received by each user are compared.
+#
+# Usage:
+#   python simulator.test.py --samples 5 --users 4 --steps 8 --seed 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulator differential test")
+    parser.add_argument("--samples", type=int, default=3, help="Number of farms")
+    parser.add_argument("--users", type=int, default=4, help="Number of stakers")
+    parser.add_argument("--steps", type=int, default=6, help="Batches per farm")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args()
+
+
+def sample_farm(rng, users, steps):
+    """Draw farm parameters and a valid timeline for `users` stakers."""
+    start_time = rng.randint(1, 1_000)
+    end_time = start_time + rng.randint(10, 10_000)
+    bonuses = {
+        (rng.randint(start_time, end_time + 100), rng.randint(1, 5))
+        for _ in range(rng.randint(0, 3))
+    }
+    farm = dict(
+        reward_supply=rng.randint(1, 10**12),
+        start_time=start_time,
+        end_time=end_time,
+        bonuses=bonuses,
+        precision=rng.choice([None, 10**6, 10**9, 10**12]),
+    )
+    amounts = [0] * users
+    timeline = []
+    times = sorted(rng.randint(start_time, end_time + 100) for _ in range(steps))
+    for now in times:
+        batch = rng.sample(range(users), rng.randint(1, users))
+        staked = [user for user in batch if amounts[user] > 0]
+        if staked and (now > end_time or rng.random() < 0.3):
+            action = rng.choice(["harvest", "withdraw"])
+        elif now <= end_time:
+            action = "deposit"
+        else:
+            continue
+        if action == "deposit":
+            step_amounts = [rng.randint(1, 10**9) for _ in batch]
+        elif action == "withdraw":
+            batch = staked
+            step_amounts = [rng.randint(1, amounts[user]) for user in batch]
+        else:
+            step_amounts = [0 for _ in batch]
+        for user, amount in zip(batch, step_amounts):
+            amounts[user] += -amount if action == "withdraw" else amount
+        timeline.append((action, now, batch, step_amounts))
+    return farm, timeline
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rng = random.Random(args.seed)
+    samples = [sample_farm(rng, args.users, args.steps) for _ in range(args.samples)]
+    admin = sp.test_account("Admin").address
+    users = [sp.test_account("User%d" % i).address for i in range(args.users)]
+
+    @sp.add_test()
+    def test():
+        sc = sp.test_scenario(
+            "SimulatorDifferential",
+            [farming_types, sp.utils, fa2_fungible, farming_contract_module],
+        )
+
+        sc.h1("Setup")
+        token = fa2_fungible.Fa2FungibleMinimal(
+            administrator=admin,
+            metadata=sp.scenario_utils.metadata_of_url("https://token.com"),
+        )
+        sc += token
+        reward_token = fa2_fungible.Fa2FungibleMinimal(
+            administrator=admin,
+            metadata=sp.scenario_utils.metadata_of_url("https://reward_token.com"),
+        )
+        sc += reward_token
+        farming_contract = farming_contract_module.FarmingContract(
+            administrator=admin,
+            metadata=sp.scenario_utils.metadata_of_url("https://example.com"),
+        )
+        sc += farming_contract
+
+        for contract in [token, reward_token]:
+            contract.mint(
+                sp.record(
+                    amount=sp.nat(10**15),
+                    to_=admin,
+                    token=sp.variant("new", {"0": sp.bytes("0x746f6b656e30")}),
+                ),
+                _sender=admin,
+            )
+        for user in users:
+            token.mint(
+                sp.record(
+                    amount=sp.nat(10**15),
+                    to_=user,
+                    token=sp.variant("existing", sp.nat(0)),
+                ),
+                _sender=admin,
+            )
+        for owner in [admin] + users:
+            token.update_operators(
+                [
+                    sp.variant(
+                        "add_operator",
+                        sp.record(
+                            owner=owner,
+                            operator=farming_contract.address,
+                            token_id=0,
+                        ),
+                    )
+                ],
+                _sender=owner,
+            )
+        reward_token.update_operators(
+            [
+                sp.variant(
+                    "add_operator",
+                    sp.record(
+                        owner=admin, operator=farming_contract.address, token_id=0
+                    ),
+                )
+            ],
+            _sender=admin,
+        )
+
+        rewards = [0] * args.users
+        for farm_id, (farm, timeline) in enumerate(samples):
+            sc.h1("Farm %d" % farm_id)
+            farming_contract.createFarm(
+                sp.record(
+                    pool_token=sp.record(
+                        address=token.address,
+                        token_id=sp.nat(0),
+                        token_type=sp.variant.fa2(()),
+                    ),
+                    reward_token=sp.record(
+                        address=reward_token.address,
+                        token_id=sp.nat(0),
+                        token_type=sp.variant.fa2(()),
+                    ),
+                    reward_supply=sp.nat(farm["reward_supply"]),
+                    start_time=sp.timestamp(farm["start_time"]),
+                    end_time=sp.timestamp(farm["end_time"]),
+                    lock_duration=sp.nat(0),
+                    payout_threshold=None,
+                    precision=(
+                        None
+                        if farm["precision"] is None
+                        else sp.Some(sp.nat(farm["precision"]))
+                    ),
+                    bonuses={
+                        sp.record(end_time=sp.timestamp(end_time), multipier=multiplier)
+                        for end_time, multiplier in farm["bonuses"]
+                    },
+                ),
+                _sender=admin,
+                _now=sp.timestamp(0),
+            )
+            simulator = FarmSimulator(args.users, **farm)
+            for action, now, batch, amounts in timeline:
+                sc.h2("%s at %d" % (action, now))
+                for user, amount in zip(batch, amounts):
+                    if action == "harvest":
+                        params = sp.nat(farm_id)
+                    else:
+                        params = sp.record(farm_id=farm_id, token_amount=amount)
+                    getattr(farming_contract, action)(
+                        params, _sender=users[user], _now=sp.timestamp(now)
+                    )
+            simulator.run(timeline)
+
+            sc.h2("Compare Farm %d" % farm_id)
+            state = farming_contract.data.farm_states[farm_id]
+            sc.verify(state.reward_per_second == simulator.reward_per_second)
+            sc.verify(state.acc_reward_per_share == simulator.acc_reward_per_share)
+            sc.verify(state.reward_paid == simulator.reward_paid)
+            sc.verify(state.pool_balance == simulator.pool_balance)
+            now = farm["end_time"] + 1_000
+            pending = simulator.pending(now)
+            for user, address in enumerate(users):
+                rewards[user] += int(simulator.rewards[user])
+                sc.verify(
+                    sc.compute(
+                        farming_contract.getPendingRewards(
+                            sp.record(farm_id=farm_id, user=address)
+                        ),
+                        now=sp.timestamp(now),
+                    )
+                    == int(pending[user])
+                )
+                if simulator.amount[user] > 0:
+                    position = farming_contract.data.ledger[(farm_id, address)]
+                    sc.verify(position.amount == int(simulator.amount[user]))
+                    sc.verify(position.reward_debt == int(simulator.reward_debt[user]))
+
+        sc.h1("Compare Rewards")
+        for user, address in enumerate(users):
+            sc.verify(reward_token.data.ledger.get((address, 0), 0) == rewards[user])
@@ -0,0 +1,3 @@
+from simulator.farm import DECIMAL, FarmSimulator, build_epochs
+
+__all__ = ["DECIMAL", "FarmSimulator", "build_epochs"]
@@ -0,0 +1,182 @@
+import bisect
+import copy
+
+import numpy as np
+
+# Off-chain replica of the farming contract reward math.
+#
+# Positions are held in numpy arrays indexed by user. Values are exact
+# integers (object dtype): `amount * acc_reward_per_share` does not fit in
+# 64 bits once scaled by the precision. Every division truncates like `sp.nat`.
+
+DECIMAL = 10**12
+
+
+def build_epochs(start_time, end_time, bonuses):
+    """Split a farm into reward epochs the way `createFarm` does.
+
+    `bonuses` is an iterable of `(end_time, multiplier)`. Returns a list of
+    `(end_time, multiplier, cumulative_weight)`.
+    """
+    if end_time <= start_time:
+        raise ValueError("InvalidFarmDuration")
+    epochs = []
+    epoch_start = start_time
+    cumulative_weight = 0
+    for bonus_end, multiplier in sorted(set(bonuses)):
+        if multiplier <= 0:
+            raise ValueError("InvalidBonus")
+        epoch_end = min(bonus_end, end_time)
+        if epoch_start < epoch_end:
+            cumulative_weight += (epoch_end - epoch_start) * multiplier
+            epochs.append((epoch_end, multiplier, cumulative_weight))
+            epoch_start = epoch_end
+    if epoch_start < end_time:
+        cumulative_weight += end_time - epoch_start
+        epochs.append((end_time, 1, cumulative_weight))
+    return epochs
+
+
+class FarmSimulator:
+    """Replay deposits, harvests and withdrawals of many users on one farm.
+
+    Each action takes a batch of distinct user indices processed at the same
+    time, in array order, as if each user had sent its own operation. The
+    rewards paid to each user are accumulated in `rewards`.
+    """
+
+    def __init__(
+        self, users, reward_supply, start_time, end_time, bonuses=(), precision=None
+    ):
+        self.precision = DECIMAL if precision is None else precision
+        self.epochs = build_epochs(start_time, end_time, bonuses)
+        self.epoch_ends = [epoch[0] for epoch in self.epochs]
+        self.reward_supply = reward_supply
+        self.reward_paid = 0
+        self.reward_per_second = reward_supply // self.epochs[-1][2]
+        self.start_time = start_time
+        self.end_time = end_time
+        self.last_reward_time = start_time
+        self.acc_reward_per_share = 0
+        self.pool_balance = 0
+        self.epoch = 0
+        self.amount = np.zeros(users, dtype=object)
+        self.reward_debt = np.zeros(users, dtype=object)
+        self.rewards = np.zeros(users, dtype=object)
+
+    def _weight_at(self, time):
+        epoch_end, multiplier, cumulative_weight = self.epochs[self.epoch]
+        return cumulative_weight - (epoch_end - time) * multiplier
+
+    def accrue(self, now):
+        accrue_until = min(now, self.end_time)
+        weighted_time = 0
+        if self.last_reward_time < accrue_until:
+            elapsed_weight = self._weight_at(self.last_reward_time)
+            self.epoch = bisect.bisect_left(
+                self.epoch_ends, accrue_until, lo=self.epoch
+            )
+            weighted_time = self._weight_at(accrue_until) - elapsed_weight
+            self.last_reward_time = accrue_until
+        if weighted_time > 0 and self.pool_balance > 0:
+            reward_accured = weighted_time * self.reward_per_second
+            self.acc_reward_per_share += (
+                reward_accured * self.precision // self.pool_balance
+            )
+
+    def _pending(self, users):
+        return (
+            self.amount[users] * self.acc_reward_per_share // self.precision
+            - self.reward_debt[users]
+        )
+
+    def _update_reward_debt(self, users):
+        self.reward_debt[users] = (
+            self.acc_reward_per_share * self.amount[users] // self.precision
+        )
+
+    def _harvest(self, users):
+        # Users are paid one after the other until the supply runs out
+        pending = self._pending(users)
+        available = max(self.reward_supply - self.reward_paid, 0)
+        paid_before = np.cumsum(pending) - pending
+        paid = np.minimum(pending, np.maximum(available - paid_before, 0))
+        self.reward_paid += int(paid.sum())
+        self.rewards[users] += paid
+        return paid
+
+    def _users(self, users):
+        users = np.asarray(users, dtype=np.int64)
+        if len(np.unique(users)) != len(users):
+            raise ValueError("Users of a batch must be distinct")
+        return users
+
+    def deposit(self, users, amounts, now):
+        users = self._users(users)
+        amounts = np.asarray(amounts, dtype=object)
+        if len(users) == 0:
+            return np.zeros(0, dtype=object)
+        if now < self.start_time:
+            raise ValueError("FarmNotStarted")
+        if now > self.end_time:
+            raise ValueError("FarmEnded")
+        if (amounts <= 0).any():
+            raise ValueError("InvalidAmount")
+        self.accrue(now)
+        paid = self._harvest(users)
+        self.pool_balance += int(amounts.sum())
+        self.amount[users] += amounts
+        self._update_reward_debt(users)
+        return paid
+
+    def harvest(self, users, now):
+        users = self._users(users)
+        # Users without deposits are skipped without accruing the farm
+        users = users[self.amount[users] > 0]
+        if len(users) == 0:
+            return np.zeros(0, dtype=object)
+        if now < self.start_time:
+            raise ValueError("FarmNotStarted")
+        self.accrue(now)
+        paid = self._harvest(users)
+        self._update_reward_debt(users)
+        return paid
+
+    def withdraw(self, users, amounts, now):
+        users = self._users(users)
+        amounts = np.asarray(amounts, dtype=object)
+        if len(users) == 0:
+            return np.zeros(0, dtype=object)
+        if now < self.start_time:
+            raise ValueError("FarmNotStarted")
+        if (self.amount[users] == 0).any():
+            raise ValueError("NoDeposits")
+        if (self.amount[users] < amounts).any():
+            raise ValueError("InsufficientDeposits")
+        self.accrue(now)
+        paid = self._harvest(users)
+        self.pool_balance -= int(amounts.sum())
+        self.amount[users] -= amounts
+        self._update_reward_debt(users)
+        return paid
+
+    def pending(self, now):
+        """Pending rewards of every user, as returned by `getPendingRewards`."""
+        if now < self.start_time:
+            return np.zeros(len(self.amount), dtype=object)
+        projection = copy.copy(self)
+        projection.accrue(now)
+        available = max(self.reward_supply - self.reward_paid, 0)
+        return np.minimum(projection._pending(np.arange(len(self.amount))), available)
+
+    def run(self, timeline):
+        """Apply `(action, now, users, amounts)` steps and return the rewards.
+
+        `amounts` is ignored for harvests.
+        """
+        for action, now, users, amounts in timeline:
+            if action == "harvest":
+                self.harvest(users, now)
+            else:
+                getattr(self, action)(users, amounts, now)
+        return self.rewards
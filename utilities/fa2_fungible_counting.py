@@ -0,0 +1,19 @@
+import smartpy as sp
+from utilities.fa2_fungible_minimal import fa2_fungible
+
+
+@sp.module
+def fa2_counting():
+    class CountingFa2Fungible(fa2_fungible.Fa2FungibleMinimal):
+        """Fa2FungibleMinimal counting its `transfer` calls, which are the
+        operations emitted by the farming contract."""
+
+        def __init__(self, administrator, metadata):
+            fa2_fungible.Fa2FungibleMinimal.__init__(self, administrator, metadata)
+            self.data.transfer_calls = sp.nat(0)
+
+        @sp.entrypoint
+        def transfer(self, batch):
+            """Same as `Fa2FungibleMinimal.transfer`, counting the calls."""
+            self.data.transfer_calls += 1
+            fa2_fungible.transfer_batch(batch)
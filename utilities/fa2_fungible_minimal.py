@@ -17,6 +17,50 @@ def fa2_fungible():
         ],
     ).layout(("requests", "callback"))
 
+    @sp.effects(with_storage="read-write")
+    def transfer_batch(batch):
+        """Settle a list of transfer operations in the ledger.
+
+        Shared by the `transfer` entrypoint of `Fa2FungibleMinimal` and of the
+        contracts extending it.
+
+        Raises:
+            `FA2_TOKEN_UNDEFINED`, `FA2_NOT_OPERATOR`, `FA2_INSUFFICIENT_BALANCE`
+        """
+        balances = sp.cast({}, sp.map[sp.pair[sp.address, sp.nat], sp.nat])
+        authorized = sp.cast(set(), sp.set[sp.pair[sp.address, sp.nat]])
+        for transfer in batch:
+            for tx in transfer.txs:
+                sp.cast(
+                    tx,
+                    sp.record(to_=sp.address, token_id=sp.nat, amount=sp.nat).layout(
+                        ("to_", ("token_id", "amount"))
+                    ),
+                )
+                assert tx.token_id < self.data.next_token_id, "FA2_TOKEN_UNDEFINED"
+                from_ = (transfer.from_, tx.token_id)
+                to_ = (tx.to_, tx.token_id)
+                if transfer.from_ != sp.sender and not authorized.contains(from_):
+                    assert self.data.operators.contains(
+                        sp.record(
+                            owner=transfer.from_,
+                            operator=sp.sender,
+                            token_id=tx.token_id,
+                        )
+                    ), "FA2_NOT_OPERATOR"
+                    authorized.add(from_)
+                if not balances.contains(from_):
+                    balances[from_] = self.data.ledger.get(from_, default=0)
+                balances[from_] = sp.as_nat(
+                    balances[from_] - tx.amount,
+                    error="FA2_INSUFFICIENT_BALANCE",
+                )
+                if not balances.contains(to_):
+                    balances[to_] = self.data.ledger.get(to_, default=0)
+                balances[to_] += tx.amount
+        for balance in balances.items():
+            self.data.ledger[balance.key] = balance.value
+
     class Fa2FungibleMinimal(sp.Contract):
         """Minimal FA2 contract for fungible tokens.
 
@@ -70,36 +114,16 @@ def fa2_fungible():
             of transactions. Each transaction specifies the destination: `to_`,
             the `token_id` and the `amount` to be transferred.
 
+            The operator authorization is checked once per `from_` and
+            `token_id`, and the balances are updated in a local map, so each
+            ledger key is read and written once per batch.
+
             Args:
                 batch: List of transfer operations.
             Raises:
                 `FA2_TOKEN_UNDEFINED`, `FA2_NOT_OPERATOR`, `FA2_INSUFFICIENT_BALANCE`
             """
-            for transfer in batch:
-                for tx in transfer.txs:
-                    sp.cast(
-                        tx,
-                        sp.record(
-                            to_=sp.address, token_id=sp.nat, amount=sp.nat
-                        ).layout(("to_", ("token_id", "amount"))),
-                    )
-                    assert tx.token_id < self.data.next_token_id, "FA2_TOKEN_UNDEFINED"
-                    from_ = (transfer.from_, tx.token_id)
-                    to_ = (tx.to_, tx.token_id)
-                    assert transfer.from_ == sp.sender or self.data.operators.contains(
-                        sp.record(
-                            owner=transfer.from_,
-                            operator=sp.sender,
-                            token_id=tx.token_id,
-                        )
-                    ), "FA2_NOT_OPERATOR"
-                    self.data.ledger[from_] = sp.as_nat(
-                        self.data.ledger.get(from_, default=0) - tx.amount,
-                        error="FA2_INSUFFICIENT_BALANCE",
-                    )
-                    self.data.ledger[to_] = (
-                        self.data.ledger.get(to_, default=0) + tx.amount
-                    )
+            transfer_batch(batch)
 
         @sp.entrypoint
         def update_operators(self, actions):
@@ -184,6 +208,41 @@ def fa2_fungible():
                         self.data.ledger.get((to_, token_id), default=0) + amount
                     )
 
+        @sp.entrypoint
+        def mint_batch(self, batch):
+            """(Admin only) Increase the supply of existing tokens and assign
+            them to several receivers.
+
+            The balances and supplies are added up in local maps, so each
+            ledger key and each `token_id` supply is written once.
+
+            Args:
+                batch: List of mints, each with the receiver `to_`, the
+                    `token_id` and the `amount` to be minted.
+            Raises:
+                `FA2_NOT_ADMIN`, `FA2_TOKEN_UNDEFINED`
+            """
+            sp.cast(
+                batch,
+                sp.list[sp.record(to_=sp.address, token_id=sp.nat, amount=sp.nat)],
+            )
+            assert sp.sender == self.data.administrator, "FA2_NOT_ADMIN"
+            supplies = sp.cast({}, sp.map[sp.nat, sp.nat])
+            balances = sp.cast({}, sp.map[sp.pair[sp.address, sp.nat], sp.nat])
+            for mint in batch:
+                assert mint.token_id < self.data.next_token_id, "FA2_TOKEN_UNDEFINED"
+                supplies[mint.token_id] = (
+                    supplies.get(mint.token_id, default=0) + mint.amount
+                )
+                to_ = (mint.to_, mint.token_id)
+                if not balances.contains(to_):
+                    balances[to_] = self.data.ledger.get(to_, default=0)
+                balances[to_] += mint.amount
+            for supply in supplies.items():
+                self.data.supply[supply.key] += supply.value
+            for balance in balances.items():
+                self.data.ledger[balance.key] = balance.value
+
         @sp.offchain_view
         def all_tokens(self):
             """(Offchain view) Return the list of all the `token_id` known to the contract."""
@@ -205,6 +264,7 @@ def fa2_fungible():
         def total_supply(self, params):
             """(Offchain view) Return the total number of tokens for the given `token_id` if known or
             fail if not."""
+            sp.cast(params, sp.record(token_id=sp.nat))
             assert params.token_id < self.data.next_token_id, "FA2_TOKEN_UNDEFINED"
             return self.data.supply.get(params.token_id, default=0)
 
@@ -212,4 +272,69 @@ def fa2_fungible():
         def is_operator(self, params):
             """(Offchain view) Return whether `operator` is allowed to transfer `token_id` tokens
             owned by `owner`."""
+            sp.cast(
+                params,
+                sp.record(
+                    owner=sp.address,
+                    operator=sp.address,
+                    token_id=sp.nat,
+                ).layout(("owner", ("operator", "token_id"))),
+            )
+            return self.data.operators.contains(params)
+
+        @sp.onchain_view()
+        def get_balance_onchain(self, params):
+            """(Onchain view) Same as `get_balance`, callable from other contracts."""
+            sp.cast(
+                params,
+                sp.record(owner=sp.address, token_id=sp.nat).layout(
+                    ("owner", "token_id")
+                ),
+            )
+            assert params.token_id < self.data.next_token_id, "FA2_TOKEN_UNDEFINED"
+            return self.data.ledger.get((params.owner, params.token_id), default=0)
+
+        @sp.onchain_view()
+        def get_balances(self, requests):
+            """(Onchain view) Return the balances of several account / token pairs,
+            in the order of the requests."""
+            sp.cast(
+                requests,
+                sp.list[
+                    sp.record(owner=sp.address, token_id=sp.nat).layout(
+                        ("owner", "token_id")
+                    )
+                ],
+            )
+            balances = []
+            for req in requests:
+                assert req.token_id < self.data.next_token_id, "FA2_TOKEN_UNDEFINED"
+                balances.push(
+                    sp.record(
+                        request=req,
+                        balance=self.data.ledger.get(
+                            (req.owner, req.token_id), default=0
+                        ),
+                    )
+                )
+            return reversed(balances)
+
+        @sp.onchain_view()
+        def total_supply_onchain(self, params):
+            """(Onchain view) Same as `total_supply`, callable from other contracts."""
+            sp.cast(params, sp.record(token_id=sp.nat))
+            assert params.token_id < self.data.next_token_id, "FA2_TOKEN_UNDEFINED"
+            return self.data.supply.get(params.token_id, default=0)
+
+        @sp.onchain_view()
+        def is_operator_onchain(self, params):
+            """(Onchain view) Same as `is_operator`, callable from other contracts."""
+            sp.cast(
+                params,
+                sp.record(
+                    owner=sp.address,
+                    operator=sp.address,
+                    token_id=sp.nat,
+                ).layout(("owner", ("operator", "token_id"))),
+            )
             return self.data.operators.contains(params)